@@ -0,0 +1,124 @@
+# --------------------------------------------------------------------------------------------------------
+# Chess with PyGame
+# Created by Martin Blore 2023
+# Full explanation can be found at https://codewithmartin.io/articles/how-to-code-a-chess-game-in-python
+# --------------------------------------------------------------------------------------------------------
+
+# Asset paths, and the optional asset bundle: every image and sound packed into one file that is memory
+# mapped at startup instead of opening and decoding each file. Images are stored already decoded as RGBA
+# pixels, so loading one is just wrapping the mapped bytes in a surface. When the bundle file exists it is
+# used, otherwise the separate files are loaded, so rebuild it after changing any of them.
+#
+# Usage:
+#   python assets.py                Build assets.bundle from the images and sounds folders.
+import mmap
+import os
+import struct
+import sys
+import pygame
+
+ASSET_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+BUNDLE_PATH = os.path.join(ASSET_DIRECTORY, "assets.bundle")
+
+# The folders packed into the bundle. Names in the bundle are "<folder>/<file>" on every platform.
+ASSET_FOLDERS = ("images", "sounds")
+
+BUNDLE_MAGIC = b"CHESSAST"
+BUNDLE_VERSION = 1
+
+# Header: magic, version, entry count. Each entry is its name length and name, then offset, length, and the
+# width and height of a decoded image (0 for everything else).
+_HEADER = struct.Struct("<8sII")
+_ENTRY = struct.Struct("<IIHH")
+_NAME_LENGTH = struct.Struct("<H")
+
+# The full path of an asset, e.g. asset_path("images", "wp.png").
+def asset_path(folder, file):
+    return os.path.join(ASSET_DIRECTORY, folder, file)
+
+class AssetBundle:
+    def __init__(self, path = BUNDLE_PATH):
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.data)
+
+        magic, version, count = _HEADER.unpack_from(self.data, 0)
+        if magic != BUNDLE_MAGIC or version != BUNDLE_VERSION:
+            self.close()
+            raise Exception("Not an asset bundle, or built by another version.")
+
+        # name -> (offset, length, width, height)
+        self.entries = {}
+        position = _HEADER.size
+        for _ in range(count):
+            (name_length,) = _NAME_LENGTH.unpack_from(self.data, position)
+            position += _NAME_LENGTH.size
+            name = bytes(self.data[position:position + name_length]).decode("utf-8")
+            position += name_length
+            self.entries[name] = _ENTRY.unpack_from(self.data, position)
+            position += _ENTRY.size
+
+    # Opens the bundle if one has been built, otherwise returns None.
+    def open_default():
+        if not os.path.exists(BUNDLE_PATH):
+            return None
+        return AssetBundle(BUNDLE_PATH)
+
+    def close(self):
+        self.view.release()
+        self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    # The raw bytes of an asset, as a view of the mapped file, so nothing is copied.
+    def raw(self, name):
+        offset, length, _, _ = self.entries[name]
+        return self.view[offset:offset + length]
+
+    # A surface over an image's pixels in the mapped file. It is only valid until the bundle is closed,
+    # so copy it (e.g. blit or convert it) before then.
+    def image(self, name):
+        offset, length, width, height = self.entries[name]
+        return pygame.image.frombuffer(self.view[offset:offset + length], (width, height), "RGBA")
+
+# Packs every file in ASSET_FOLDERS into one bundle, decoding the images.
+def build_bundle(path = BUNDLE_PATH):
+    assets = []
+    for folder in ASSET_FOLDERS:
+        for file in sorted(os.listdir(os.path.join(ASSET_DIRECTORY, folder))):
+            full_path = asset_path(folder, file)
+            if file.lower().endswith(".png"):
+                image = pygame.image.load(full_path)
+                data = pygame.image.tobytes(image, "RGBA")
+                width, height = image.get_size()
+            else:
+                with open(full_path, "rb") as asset_file:
+                    data = asset_file.read()
+                width, height = 0, 0
+            assets.append((folder + "/" + file, data, width, height))
+
+    names = [name.encode("utf-8") for name, _, _, _ in assets]
+    offset = _HEADER.size + sum(_NAME_LENGTH.size + len(name) + _ENTRY.size for name in names)
+
+    with open(path, "wb") as bundle:
+        bundle.write(_HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, len(assets)))
+        for name, (_, data, width, height) in zip(names, assets):
+            bundle.write(_NAME_LENGTH.pack(len(name)) + name)
+            bundle.write(_ENTRY.pack(offset, len(data), width, height))
+            offset += len(data)
+        for _, data, _, _ in assets:
+            bundle.write(data)
+
+    return len(assets)
+
+if __name__ == "__main__":
+    count = build_bundle(sys.argv[1] if len(sys.argv) > 1 else BUNDLE_PATH)
+    print("Bundled {} assets.".format(count))
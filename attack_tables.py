@@ -0,0 +1,139 @@
+# --------------------------------------------------------------------------------------------------------
+# Chess with PyGame
+# Created by Martin Blore 2023
+# Full explanation can be found at https://codewithmartin.io/articles/how-to-code-a-chess-game-in-python
+# --------------------------------------------------------------------------------------------------------
+
+# Per-square attack tables, built once when the module is first imported.
+# Every table is indexed by the bitboard square index (row * 8 + col).
+
+KNIGHT_OFFSETS = [(-2, 1), (-2, -1), (2, -1), (2, 1), (1, 2), (-1, 2), (-1, -2), (1, -2)]
+KING_OFFSETS = [(0, 1), (0, -1), (-1, 0), (1, 0), (-1, 1), (-1, -1), (1, 1), (1, -1)]
+
+# Builds a table of attack masks for a piece that jumps by fixed row/col offsets.
+def _build_offset_table(offsets):
+    table = []
+    for index in range(64):
+        row = index // 8
+        col = index % 8
+        mask = 0
+        for offset in offsets:
+            to_row = row + offset[0]
+            to_col = col + offset[1]
+            if to_row >= 0 and to_row <= 7 and to_col >= 0 and to_col <= 7:
+                mask |= 1 << (to_row * 8 + to_col)
+        table.append(mask)
+    return table
+
+KNIGHT_ATTACKS = _build_offset_table(KNIGHT_OFFSETS)
+KING_ATTACKS = _build_offset_table(KING_OFFSETS)
+
+# Pawn tables are indexed by colour first (0 = white, 1 = black). White pawns move up the board (row - 1).
+PAWN_ATTACKS = [_build_offset_table([(-1, -1), (-1, 1)]), _build_offset_table([(1, -1), (1, 1)])]
+PAWN_PUSHES = [_build_offset_table([(-1, 0)]), _build_offset_table([(1, 0)])]
+
+# The double step square, only set for pawns still on their starting row.
+PAWN_DOUBLE_PUSHES = [
+    [(1 << (index - 16)) if index // 8 == 6 else 0 for index in range(64)],
+    [(1 << (index + 16)) if index // 8 == 1 else 0 for index in range(64)]
+]
+
+# Sliding piece directions as row/col steps. Rooks use the first four, bishops the last four.
+ROOK_DIRECTIONS = [(0, 1), (0, -1), (-1, 0), (1, 0)]
+BISHOP_DIRECTIONS = [(-1, 1), (1, 1), (-1, -1), (1, -1)]
+
+# Builds the ray of squares leaving a square in one direction, up to the board edge.
+def _build_ray_table(direction):
+    table = []
+    for index in range(64):
+        row = index // 8 + direction[0]
+        col = index % 8 + direction[1]
+        mask = 0
+        while row >= 0 and row <= 7 and col >= 0 and col <= 7:
+            mask |= 1 << (row * 8 + col)
+            row += direction[0]
+            col += direction[1]
+        table.append(mask)
+    return table
+
+# RAYS[direction] is indexed by square and keyed by the direction tuples above.
+RAYS = {direction: _build_ray_table(direction) for direction in ROOK_DIRECTIONS + BISHOP_DIRECTIONS}
+
+# Squares strictly between two squares that share a rank, file or diagonal, 0 for any other pair.
+# Used for the squares a piece can block a slider's check on, and the line a pinned piece is held to.
+def _build_between_table():
+    table = [[0] * 64 for _ in range(64)]
+    for rays in RAYS.values():
+        for index in range(64):
+            ray = rays[index]
+            while ray:
+                target = (ray & -ray).bit_length() - 1
+                table[index][target] = rays[index] ^ rays[target] ^ (1 << target)
+                ray &= ray - 1
+    return table
+
+BETWEEN = _build_between_table()
+
+# Attacks along one ray given the board occupancy, stopping on (and including) the first blocker.
+def _ray_attacks(direction, index, occupied):
+    ray = RAYS[direction][index]
+    blockers = ray & occupied
+    if blockers:
+        # Rays heading towards higher square indexes are blocked by the lowest set bit, the others by the highest.
+        if direction[0] * 8 + direction[1] > 0:
+            first = (blockers & -blockers).bit_length() - 1
+        else:
+            first = blockers.bit_length() - 1
+        ray ^= RAYS[direction][first]
+    return ray
+
+# The squares whose occupancy can change a slider's attacks. Board edges never block anything further, so they're left out.
+def _build_relevant_mask(index, directions):
+    mask = 0
+    for direction in directions:
+        row = index // 8
+        col = index % 8
+        while True:
+            row += direction[0]
+            col += direction[1]
+            if row + direction[0] < 0 or row + direction[0] > 7 or col + direction[1] < 0 or col + direction[1] > 7:
+                break
+            mask |= 1 << (row * 8 + col)
+    return mask
+
+# Builds one lookup per square that maps every relevant occupancy subset straight to its attack set.
+# A dict keyed by the masked occupancy acts as a collision free (perfect) hash, and in CPython it is
+# quicker than the multiply-and-shift indexing that magic bitboards use in C engines.
+def _build_slider_tables(directions):
+    masks = []
+    tables = []
+    for index in range(64):
+        mask = _build_relevant_mask(index, directions)
+        table = {}
+        subset = 0
+        while True:
+            attacks = 0
+            for direction in directions:
+                attacks |= _ray_attacks(direction, index, subset)
+            table[subset] = attacks
+            # Carry-rippler trick to step through every subset of the mask.
+            subset = (subset - mask) & mask
+            if subset == 0:
+                break
+        masks.append(mask)
+        tables.append(table)
+    return masks, tables
+
+ROOK_MASKS, ROOK_TABLES = _build_slider_tables(ROOK_DIRECTIONS)
+BISHOP_MASKS, BISHOP_TABLES = _build_slider_tables(BISHOP_DIRECTIONS)
+
+# Constant time slider attacks for a square index and board occupancy.
+def rook_attacks(index, occupied):
+    return ROOK_TABLES[index][occupied & ROOK_MASKS[index]]
+
+def bishop_attacks(index, occupied):
+    return BISHOP_TABLES[index][occupied & BISHOP_MASKS[index]]
+
+def queen_attacks(index, occupied):
+    return (ROOK_TABLES[index][occupied & ROOK_MASKS[index]] |
+        BISHOP_TABLES[index][occupied & BISHOP_MASKS[index]])
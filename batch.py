@@ -0,0 +1,387 @@
+# --------------------------------------------------------------------------------------------------------
+# Chess with PyGame
+# Created by Martin Blore 2023
+# Full explanation can be found at https://codewithmartin.io/articles/how-to-code-a-chess-game-in-python
+# --------------------------------------------------------------------------------------------------------
+
+# Scores many positions at once. Positions are stored as stacked bitboard arrays, and every step of
+# the analysis (attack maps, checks, pins, move counts) is a NumPy operation over the whole batch, so
+# the Python loops only run over directions and piece types, never over positions.
+#
+# Usage:
+#   batch = PositionBatch.from_fens(fens)       # or PositionBatch.from_boards(boards)
+#   result = analyse(batch)
+#   result.legal_moves, result.in_check, result.checkmate, result.stalemate, result.evaluation
+#
+# NumPy is only needed by this module, the rest of the rules code runs without it.
+import numpy as np
+from board_setup import FEN_PIECES
+from evaluation import ENDGAME_VALUES, MAX_PHASE, MIDDLEGAME_VALUES, PHASE_WEIGHTS
+from piece import BISHOP, BLACK, KING, KNIGHT, PAWN, PIECE_CODES, QUEEN, ROOK
+
+# Positions are analysed in slices of this many, so the temporary arrays stay small enough to keep in cache.
+DEFAULT_CHUNK_SIZE = 16384
+
+_ALL = np.uint64(0xFFFFFFFFFFFFFFFF)
+_ZERO = np.uint64(0)
+
+# Bitboard squares are numbered row * 8 + col with row 0 as the 8th rank (see bitboard.py), so each row
+# is one byte and a byte swap mirrors the board top to bottom.
+_FILE_A = 0x0101010101010101
+_FILE_B = _FILE_A << 1
+_FILE_G = _FILE_A << 6
+_FILE_H = _FILE_A << 7
+_RANK_8 = np.uint64(0x00000000000000FF)
+_RANK_3 = np.uint64(0x0000FF0000000000)
+
+# Mask applied after a shift that moves pieces towards the given column offset, clearing the
+# squares that wrapped around from the other edge of the board.
+_WRAP_MASKS = {
+    -2: np.uint64(~(_FILE_G | _FILE_H) & 0xFFFFFFFFFFFFFFFF),
+    -1: np.uint64(~_FILE_H & 0xFFFFFFFFFFFFFFFF),
+    0: _ALL,
+    1: np.uint64(~_FILE_A & 0xFFFFFFFFFFFFFFFF),
+    2: np.uint64(~(_FILE_A | _FILE_B) & 0xFFFFFFFFFFFFFFFF),
+}
+
+# (row, col) steps. Index i and i ^ 1 are opposite directions, so a pin along either lies on the same line.
+ROOK_STEPS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+BISHOP_STEPS = ((-1, -1), (1, 1), (-1, 1), (1, -1))
+KNIGHT_STEPS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+KING_STEPS = ROOK_STEPS + BISHOP_STEPS
+
+# Castling squares for the side to move once the batch is mirrored so it is always white.
+_KING_START = np.uint64(1 << 60)
+_KING_SIDE_ROOK = np.uint64(1 << 63)
+_QUEEN_SIDE_ROOK = np.uint64(1 << 56)
+_KING_SIDE_EMPTY = np.uint64((1 << 61) | (1 << 62))
+_QUEEN_SIDE_EMPTY = np.uint64((1 << 57) | (1 << 58) | (1 << 59))
+_QUEEN_SIDE_SAFE = np.uint64((1 << 58) | (1 << 59))
+
+# Stacked positions, one row per position.
+class PositionBatch:
+    def __init__(self, size):
+        # Bitboards indexed by piece code, the same layout as Bitboards.pieces.
+        self.pieces = np.zeros((size, PIECE_CODES), dtype=np.uint64)
+        self.white_to_move = np.ones(size, dtype=bool)
+
+        # Castling rights as 4 bits, in the order Board._castling_rights uses.
+        self.castling = np.zeros(size, dtype=np.uint8)
+
+        # Bit of the square a pawn can capture en-passant onto, 0 if there is none.
+        self.en_passant = np.zeros(size, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.white_to_move)
+
+    def from_boards(boards):
+        batch = PositionBatch(len(boards))
+        for i, board in enumerate(boards):
+            batch.set_board(i, board)
+        return batch
+
+    def from_fens(fens):
+        batch = PositionBatch(len(fens))
+        for i, fen in enumerate(fens):
+            batch.set_fen(i, fen)
+        return batch
+
+    def set_board(self, i, board):
+        self.pieces[i] = board.bitboards.pieces
+        self.white_to_move[i] = board.whites_turn
+        self.castling[i] = board._castling_rights()
+
+        # The board only stores the last move, the target square is the one the pawn stepped over.
+        self.en_passant[i] = 0
+        en_passant_file = board._en_passant_file()
+        if en_passant_file != -1:
+            row = 2 if board.whites_turn else 5
+            self.en_passant[i] = 1 << (row * 8 + en_passant_file)
+
+    # Fills a row straight from a FEN string, without building a Board.
+    def set_fen(self, i, fen):
+        fields = fen.split()
+        if len(fields) < 4:
+            raise Exception("Invalid FEN string.")
+
+        pieces = [0] * PIECE_CODES
+        index = 0
+        for char in fields[0]:
+            if char == "/":
+                continue
+            if char.isdigit():
+                index += int(char)
+            else:
+                pieces[FEN_PIECES[char]] |= 1 << index
+                index += 1
+        if index != 64:
+            raise Exception("Invalid FEN string.")
+
+        self.pieces[i] = pieces
+        self.white_to_move[i] = fields[1] == "w"
+
+        castling = 0
+        for bit, letter in enumerate("KQkq"):
+            if letter in fields[2]:
+                castling |= 1 << bit
+        self.castling[i] = castling
+
+        self.en_passant[i] = 0
+        if fields[3] != "-":
+            col = ord(fields[3][0]) - ord("a")
+            row = 8 - int(fields[3][1])
+            self.en_passant[i] = 1 << (row * 8 + col)
+
+# Per position results of analyse(), each an array with one entry per position.
+class BatchResult:
+    def __init__(self, size):
+        self.legal_moves = np.zeros(size, dtype=np.int32)
+        self.in_check = np.zeros(size, dtype=bool)
+        self.checkmate = np.zeros(size, dtype=bool)
+        self.stalemate = np.zeros(size, dtype=bool)
+
+        # Material and piece-square score in centipawns from the point of view of the side to move, the same as
+        # evaluation.evaluate_material on a Board.
+        self.evaluation = np.zeros(size, dtype=np.int32)
+
+# Counts legal moves and finds check, checkmate and stalemate for every position in the batch.
+def analyse(batch, chunk_size = DEFAULT_CHUNK_SIZE):
+    size = len(batch)
+    result = BatchResult(size)
+    for start in range(0, size, chunk_size):
+        end = min(start + chunk_size, size)
+        own, their, castling, en_passant = _side_to_move_view(batch, start, end)
+
+        legal_moves, in_check = _count_legal_moves(own, their, castling, en_passant)
+        result.legal_moves[start:end] = legal_moves
+        result.in_check[start:end] = in_check
+        result.checkmate[start:end] = in_check & (legal_moves == 0)
+        result.stalemate[start:end] = ~in_check & (legal_moves == 0)
+        result.evaluation[start:end] = _material(own, their)
+    return result
+
+# Material and piece-square score only, for when the move counts aren't needed.
+def evaluate(batch, chunk_size = DEFAULT_CHUNK_SIZE):
+    size = len(batch)
+    evaluation = np.zeros(size, dtype=np.int32)
+    for start in range(0, size, chunk_size):
+        end = min(start + chunk_size, size)
+        own, their, _, _ = _side_to_move_view(batch, start, end)
+        evaluation[start:end] = _material(own, their)
+    return evaluation
+
+# Mirrors the positions with black to move and swaps the colours, so the kernels only ever have to
+# generate moves for white. Returns piece bitboards indexed by piece type for each side.
+def _side_to_move_view(batch, start, end):
+    pieces = batch.pieces[start:end]
+    white = batch.white_to_move[start:end]
+
+    own = [None] * (KING + 1)
+    their = [None] * (KING + 1)
+    for piece_type in range(PAWN, KING + 1):
+        white_pieces = pieces[:, piece_type]
+        black_pieces = pieces[:, BLACK | piece_type]
+        own[piece_type] = np.where(white, white_pieces, black_pieces.byteswap())
+        their[piece_type] = np.where(white, black_pieces, white_pieces.byteswap())
+
+    castling = batch.castling[start:end]
+    castling = np.where(white, castling & 3, castling >> 2)
+
+    en_passant = batch.en_passant[start:end]
+    en_passant = np.where(white, en_passant, en_passant.byteswap())
+
+    return own, their, castling, en_passant
+
+# Piece-square values summed over each byte (row) of a bitboard: _BYTE_VALUES[piece][row][byte], where the
+# piece is a piece code as in evaluation.MIDDLEGAME_VALUES. The side to move's pieces are always white in
+# the view from _side_to_move_view, so they use the white codes and the other side the black codes.
+def _byte_values(values):
+    bits = (np.arange(256)[:, None] >> np.arange(8)) & 1
+    table = np.zeros((PIECE_CODES, 8, 256), dtype=np.int64)
+    for piece in range(PIECE_CODES):
+        table[piece] = (bits @ np.array(values[piece], dtype=np.int64).reshape(8, 8).T).T
+    return table
+
+_MIDDLEGAME_BYTE_VALUES = _byte_values(MIDDLEGAME_VALUES)
+_ENDGAME_BYTE_VALUES = _byte_values(ENDGAME_VALUES)
+
+# Material and piece-square tables blended by game phase, as evaluation.evaluate_material.
+def _material(own, their):
+    size = len(own[PAWN])
+    middlegame = np.zeros(size, dtype=np.int64)
+    endgame = np.zeros(size, dtype=np.int64)
+    phase = np.zeros(size, dtype=np.int64)
+    for piece_type in range(PAWN, KING + 1):
+        phase += PHASE_WEIGHTS[piece_type] * (_popcount(own[piece_type]) + _popcount(their[piece_type]))
+        for piece, bitboards in ((piece_type, own[piece_type]), (BLACK | piece_type, their[piece_type])):
+            for row in range(8):
+                row_bytes = ((bitboards >> np.uint64(row * 8)) & np.uint64(255)).astype(np.intp)
+                middlegame += _MIDDLEGAME_BYTE_VALUES[piece, row][row_bytes]
+                endgame += _ENDGAME_BYTE_VALUES[piece, row][row_bytes]
+
+    phase = np.minimum(phase, MAX_PHASE)
+    return (middlegame * phase + endgame * (MAX_PHASE - phase)) // MAX_PHASE
+
+def _count_legal_moves(own, their, castling, en_passant):
+    us = own[PAWN] | own[KNIGHT] | own[BISHOP] | own[ROOK] | own[QUEEN] | own[KING]
+    them = their[PAWN] | their[KNIGHT] | their[BISHOP] | their[ROOK] | their[QUEEN] | their[KING]
+    occupied = us | them
+    empty = ~occupied
+    king = own[KING]
+
+    their_straight = their[ROOK] | their[QUEEN]
+    their_diagonal = their[BISHOP] | their[QUEEN]
+
+    # Squares the opponent attacks. Our king is taken off the board first, so it can't
+    # step backwards along the line of a slider that is checking it.
+    attacked = _pawn_attacks_down(their[PAWN]) | _step_set(their[KNIGHT], KNIGHT_STEPS) | _step_set(their[KING], KING_STEPS)
+    empty_without_king = empty | king
+    for step in ROOK_STEPS:
+        attacked |= _slide(their_straight, empty_without_king, step)
+    for step in BISHOP_STEPS:
+        attacked |= _slide(their_diagonal, empty_without_king, step)
+
+    # Pieces giving check. A move that doesn't take the king out of check has to land on check_mask:
+    # the checking piece or, for a slider, a square between it and the king.
+    checkers = (_step_set(king, KNIGHT_STEPS) & their[KNIGHT]) | (_pawn_attacks_up(king) & their[PAWN])
+    check_mask = checkers
+
+    # A piece is pinned when the ray from our king passes through exactly one of our own pieces before
+    # reaching an enemy slider that moves along it. pinned_lines[i] holds the pieces pinned along ray i.
+    pinned_lines = []
+    for steps, sliders in ((ROOK_STEPS, their_straight), (BISHOP_STEPS, their_diagonal)):
+        for step in steps:
+            ray = _slide(king, empty, step)
+            checking = (ray & sliders) != _ZERO
+            checkers = checkers | np.where(checking, ray & sliders, _ZERO)
+            check_mask = check_mask | np.where(checking, ray, _ZERO)
+
+            xray = _slide(king, ~them, step)
+            blockers = xray & us
+            pinned = ((xray & sliders) != _ZERO) & (_popcount(blockers) == 1)
+            pinned_lines.append(np.where(pinned, blockers, _ZERO))
+
+    checker_count = _popcount(checkers)
+    in_check = checker_count > 0
+    check_mask = np.where(checker_count == 0, _ALL, np.where(checker_count == 1, check_mask, _ZERO))
+
+    pinned = _ZERO
+    for line in pinned_lines:
+        pinned = pinned | line
+    free = ~pinned
+
+    targets = ~us & check_mask
+    count = np.zeros(len(king), dtype=np.int64)
+
+    # Knights can never move along a pin.
+    knights = own[KNIGHT] & free
+    for step in KNIGHT_STEPS:
+        count += _popcount(_shift(knights, step) & targets)
+
+    # Sliders in one direction: the rays from different pieces stop at each other, so they never
+    # overlap and the union can be counted in one go. A pinned slider may still move along its pin.
+    for line_index, step in enumerate(ROOK_STEPS + BISHOP_STEPS):
+        if line_index < 4:
+            sliders = own[ROOK] | own[QUEEN]
+        else:
+            sliders = own[BISHOP] | own[QUEEN]
+        movers = sliders & (free | pinned_lines[line_index] | pinned_lines[line_index ^ 1])
+        count += _popcount(_slide(movers, empty, step) & targets)
+
+    # Pawns. Pushes run along ray 0/1 (the file), captures along the diagonal rays 4/5 and 6/7.
+    pawns = own[PAWN]
+    pushers = pawns & (free | pinned_lines[0] | pinned_lines[1])
+    single = _shift(pushers, (-1, 0)) & empty
+    double = _shift(single & _RANK_3, (-1, 0)) & empty & check_mask
+    single &= check_mask
+    count += _popcount(single & ~_RANK_8) + 4 * _popcount(single & _RANK_8) + _popcount(double)
+
+    for step, first_line in (((-1, -1), 4), ((-1, 1), 6)):
+        capturers = pawns & (free | pinned_lines[first_line] | pinned_lines[first_line + 1])
+        captures = _shift(capturers, step) & them & check_mask
+        count += _popcount(captures & ~_RANK_8) + 4 * _popcount(captures & _RANK_8)
+
+    # En-passant removes two pieces from one line, which the pin masks can't describe, so each
+    # capture is played out on the occupancy and the king tested directly. Few positions have one.
+    captured = _shift(en_passant, (1, 0)) & their[PAWN]
+    for step in ((1, 1), (1, -1)):
+        capturer = _shift(en_passant, step) & pawns & np.where(captured != _ZERO, _ALL, _ZERO)
+        occupied_after = occupied ^ capturer ^ en_passant ^ captured
+        safe = ~_is_attacked(king, occupied_after, their, captured)
+        count += ((capturer != _ZERO) & safe).astype(np.int64)
+
+    # The king itself, onto any square the opponent doesn't attack.
+    count += _popcount(_step_set(king, KING_STEPS) & ~us & ~attacked)
+
+    # Castling: out of check, through empty squares and not through or into an attacked square.
+    can_castle = ~in_check & (king == _KING_START)
+    king_side = (can_castle & ((castling & 1) != 0) & ((own[ROOK] & _KING_SIDE_ROOK) != _ZERO) &
+        ((occupied & _KING_SIDE_EMPTY) == _ZERO) & ((attacked & _KING_SIDE_EMPTY) == _ZERO))
+    queen_side = (can_castle & ((castling & 2) != 0) & ((own[ROOK] & _QUEEN_SIDE_ROOK) != _ZERO) &
+        ((occupied & _QUEEN_SIDE_EMPTY) == _ZERO) & ((attacked & _QUEEN_SIDE_SAFE) == _ZERO))
+    count += king_side.astype(np.int64) + queen_side.astype(np.int64)
+
+    return count.astype(np.int32), in_check
+
+# True where the king is attacked once the pieces in removed have been taken off, used to test en-passant.
+def _is_attacked(king, occupied, their, removed):
+    empty = ~occupied
+    attackers = (_step_set(king, KNIGHT_STEPS) & their[KNIGHT]) | (_pawn_attacks_up(king) & their[PAWN] & ~removed)
+    for step in ROOK_STEPS:
+        attackers |= _slide(king, empty, step) & (their[ROOK] | their[QUEEN])
+    for step in BISHOP_STEPS:
+        attackers |= _slide(king, empty, step) & (their[BISHOP] | their[QUEEN])
+    return attackers != _ZERO
+
+# Moves every bit one (row, col) step, dropping bits that leave the board.
+def _shift(bitboards, step):
+    amount = step[0] * 8 + step[1]
+    if amount > 0:
+        shifted = bitboards << np.uint64(amount)
+    else:
+        shifted = bitboards >> np.uint64(-amount)
+    return shifted & _WRAP_MASKS[step[1]]
+
+# Every square reached by one step from any of the pieces.
+def _step_set(pieces, steps):
+    result = _ZERO
+    for step in steps:
+        result = result | _shift(pieces, step)
+    return result
+
+def _pawn_attacks_up(pawns):
+    return _shift(pawns, (-1, -1)) | _shift(pawns, (-1, 1))
+
+def _pawn_attacks_down(pawns):
+    return _shift(pawns, (1, -1)) | _shift(pawns, (1, 1))
+
+# Slider attacks from every piece in one direction, up to and including the first occupied square.
+# Kogge-Stone fill: the sliding set doubles its reach on each of the three rounds.
+def _slide(pieces, empty, step):
+    empty = empty & _WRAP_MASKS[step[1]]
+    pieces = pieces | (empty & _shift(pieces, step))
+    empty = empty & _shift(empty, step)
+    double = (step[0] * 2, step[1] * 2)
+    pieces = pieces | (empty & _shift_unmasked(pieces, double))
+    empty = empty & _shift_unmasked(empty, double)
+    quadruple = (step[0] * 4, step[1] * 4)
+    pieces = pieces | (empty & _shift_unmasked(pieces, quadruple))
+    return _shift(pieces, step)
+
+# The longer Kogge-Stone shifts rely on empty already carrying the wrap mask.
+def _shift_unmasked(bitboards, step):
+    amount = step[0] * 8 + step[1]
+    if amount > 0:
+        return bitboards << np.uint64(amount)
+    return bitboards >> np.uint64(-amount)
+
+if hasattr(np, "bitwise_count"):
+    def _popcount(bitboards):
+        return np.bitwise_count(bitboards).astype(np.int64)
+else:
+    # NumPy before 2.0 has no popcount, fall back to the usual SWAR bit count.
+    def _popcount(bitboards):
+        bitboards = bitboards - ((bitboards >> np.uint64(1)) & np.uint64(0x5555555555555555))
+        bitboards = (bitboards & np.uint64(0x3333333333333333)) + ((bitboards >> np.uint64(2)) & np.uint64(0x3333333333333333))
+        bitboards = (bitboards + (bitboards >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+        return ((bitboards * np.uint64(0x0101010101010101)) >> np.uint64(56)).astype(np.int64)
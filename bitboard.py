@@ -0,0 +1,85 @@
+# --------------------------------------------------------------------------------------------------------
+# Chess with PyGame
+# Created by Martin Blore 2023
+# Full explanation can be found at https://codewithmartin.io/articles/how-to-code-a-chess-game-in-python
+# --------------------------------------------------------------------------------------------------------
+from piece import BLACK, PIECE_CODES
+
+'''
+Bitboards use one bit per square, numbered in the same order as the board_state rows
+so the square index is row * 8 + col:
+
+0       1       2       3       4       5       6       7
+8       9       10      11      12      13      14      15
+...
+56      57      58      59      60      61      62      63
+'''
+
+# Row/col tuple for every square index, built once so lookups don't allocate new tuples.
+SQUARE_TO_POS = [(index // 8, index % 8) for index in range(64)]
+
+# Single bit mask for every square index.
+SQUARE_BITS = [1 << index for index in range(64)]
+
+# Holds one 64-bit integer per piece code plus the combined occupancy masks.
+class Bitboards:
+    def __init__(self):
+        # Indexed by the piece code, index 0 (EMPTY) is never set.
+        self.pieces = [0] * PIECE_CODES
+        self.white = 0
+        self.black = 0
+        self.occupied = 0
+
+    def clear(self):
+        for i in range(0, PIECE_CODES):
+            self.pieces[i] = 0
+        self.white = 0
+        self.black = 0
+        self.occupied = 0
+
+    def add_piece(self, piece, index):
+        bit = SQUARE_BITS[index]
+        self.pieces[piece] |= bit
+        if piece & BLACK:
+            self.black |= bit
+        else:
+            self.white |= bit
+        self.occupied |= bit
+
+    def remove_piece(self, piece, index):
+        mask = ~SQUARE_BITS[index]
+        self.pieces[piece] &= mask
+        self.white &= mask
+        self.black &= mask
+        self.occupied &= mask
+
+    # Returns the occupancy mask for one side.
+    def side(self, white):
+        return self.white if white else self.black
+
+    # Converts a row/col square to its bit index.
+    def index(square):
+        return square[0] * 8 + square[1]
+
+    # Yields the bit index of every set bit, lowest first.
+    def indexes(bitboard):
+        while bitboard:
+            low_bit = bitboard & -bitboard
+            yield low_bit.bit_length() - 1
+            bitboard ^= low_bit
+
+    # Yields the row/col square of every set bit, lowest first.
+    def squares(bitboard):
+        while bitboard:
+            low_bit = bitboard & -bitboard
+            yield SQUARE_TO_POS[low_bit.bit_length() - 1]
+            bitboard ^= low_bit
+
+    # Builds the list of row/col squares for every set bit.
+    def to_squares(bitboard):
+        squares = []
+        while bitboard:
+            low_bit = bitboard & -bitboard
+            squares.append(SQUARE_TO_POS[low_bit.bit_length() - 1])
+            bitboard ^= low_bit
+        return squares
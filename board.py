@@ -3,26 +3,43 @@
 # Created by Martin Blore 2023
 # Full explanation can be found at https://codewithmartin.io/articles/how-to-code-a-chess-game-in-python
 # --------------------------------------------------------------------------------------------------------
-import math
-import pygame
-from board_render import BoardRender
-from board_setup import BoardSetup
+from attack_tables import (BETWEEN, KING_ATTACKS, KNIGHT_ATTACKS, PAWN_ATTACKS, PAWN_DOUBLE_PUSHES, PAWN_PUSHES,
+    bishop_attacks, queen_attacks, rook_attacks)
+from bitboard import SQUARE_BITS, SQUARE_TO_POS, Bitboards
+from board_setup import FEN_PIECES, BoardSetup
+from evaluation import ENDGAME_VALUES, MIDDLEGAME_VALUES, PIECE_PHASES
+from move import (CAPTURE, DOUBLE_PAWN_PUSH, EN_PASSANT, KING_CASTLE, MAX_MOVES, PROMOTION, PROMOTION_TYPES, QUEEN_CASTLE,
+    Move)
 from move_result import MoveResult
-from piece import Piece
+from piece import (BISHOP, BLACK, BLACK_BISHOP, BLACK_KING, BLACK_KNIGHT, BLACK_PAWN, BLACK_QUEEN, BLACK_ROOK, EMPTY,
+    KNIGHT, PAWN, QUEEN, ROOK, WHITE_BISHOP, WHITE_KING, WHITE_KNIGHT, WHITE_PAWN, WHITE_QUEEN, WHITE_ROOK)
 from piece_moves import PieceMoves
+from zobrist import BLACK_TO_MOVE_KEY, CASTLING_KEYS, EN_PASSANT_KEYS, PIECE_SQUARE_KEYS
+
+PROMOTION_PIECES_WHITE = (WHITE_QUEEN, WHITE_ROOK, WHITE_BISHOP, WHITE_KNIGHT)
+PROMOTION_PIECES_BLACK = (BLACK_QUEEN, BLACK_ROOK, BLACK_BISHOP, BLACK_KNIGHT)
+
+# FEN letter for each piece code, and the run lengths of empty squares.
+FEN_LETTERS = {piece: letter for letter, piece in FEN_PIECES.items()}
+FEN_EMPTY_RUNS = {str(count): count for count in range(1, 9)}
+
+# Game results, as written in PGN.
+RESULT_ONGOING = "*"
+RESULT_WHITE_WINS = "1-0"
+RESULT_BLACK_WINS = "0-1"
+RESULT_DRAW = "1/2-1/2"
+
+# Why a game ended.
+CHECKMATE = "checkmate"
+STALEMATE = "stalemate"
+FIFTY_MOVE_RULE = "fifty-move rule"
+
+# Length of the bytes made by Board.encode.
+ENCODED_SIZE = 40
     
 class Board:
     def __init__(self):
-        self.board_state = [
-            [0,0,0,0,0,0,0,0],
-            [0,0,0,0,0,0,0,0],
-            [0,0,0,0,0,0,0,0],
-            [0,0,0,0,0,0,0,0],
-            [0,0,0,0,0,0,0,0],
-            [0,0,0,0,0,0,0,0],
-            [0,0,0,0,0,0,0,0],
-            [0,0,0,0,0,0,0,0]
-        ]
+        self.board_state = [[EMPTY] * 8 for _ in range(8)]
 
         '''
         Board indexes for reference:
@@ -37,15 +54,18 @@ class Board:
         7,0     7,1     7,2     7,3     7,4     7,5     7,6     7,7
         '''
 
-        self.cell_size = 100
-        self.board_start_x = 100
-        self.board_start_y = 100
-        self.hide_row_index = -1
-        self.hide_col_index = -1
-        self.white_square_color = (230, 230, 230)
-        self.black_square_color = (100, 150, 100)
-        self.start_drag_square = (-1, -1)
-        self.dragging_piece = Piece.NONE
+        # Bitboard copy of board_state, kept in sync by set_piece and used for the rules queries.
+        self.bitboards = Bitboards()
+
+        # King squares, kept up to date by set_piece so check tests never have to search for them.
+        self.white_king_square = (-1, -1)
+        self.black_king_square = (-1, -1)
+
+        # Running material plus piece-square totals (white's point of view) and game phase, kept up to date
+        # by set_piece so evaluation never has to scan the board for them. See evaluation.py.
+        self.middlegame_score = 0
+        self.endgame_score = 0
+        self.phase = 0
 
         # Castling state variables.
         self.white_king_moved = False
@@ -56,339 +76,884 @@ class Board:
         self.black_queen_side_rook_moved = False
 
         # Last moved piece to assist with the en-passant logic.
-        self.last_moved_piece = Piece.NONE
+        self.last_moved_piece = EMPTY
         self.last_moved_piece_from = (0,0)
+        self.last_moved_piece_to = (0,0)
+
+        # The side to move for generate_legal_moves/make_move, flipped on every move.
+        self.whites_turn = True
+
+        # Moves since the last capture or pawn move (for the fifty-move rule), and the FEN move number,
+        # which starts at 1 and goes up after every black move.
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+
+        # Game state after the last move played with play_move/perform_move: whether the side to move is in check,
+        # the result and what ended the game (None while it's ongoing). make_move/unmake_move don't touch these,
+        # so searches don't pay for them.
+        self.in_check = False
+        self.result = RESULT_ONGOING
+        self.result_reason = None
+
+        # Undo records pushed by make_move and popped by unmake_move.
+        self.move_stack = []
+
+        # Reused by generate_legal_moves, so the tuple API doesn't need its own buffer allocated every call.
+        self.move_buffer = [0] * MAX_MOVES
+
+        # 64-bit Zobrist hash of the position, updated on every change rather than recomputed.
+        self.zobrist_key = self.compute_zobrist_key()
 
     # Clears the board.
     def clear(self):
         for row_index, row in enumerate(self.board_state):
             for col_index, col in enumerate(row):
-                self.board_state[row_index][col_index] = Piece.NONE
+                self.board_state[row_index][col_index] = EMPTY
+        self.bitboards.clear()
+        self.white_king_square = (-1, -1)
+        self.black_king_square = (-1, -1)
+        self.middlegame_score = 0
+        self.endgame_score = 0
+        self.phase = 0
+        self.zobrist_key = self._zobrist_state_key()
+
+    # Places a piece (or EMPTY) on a square, keeping the bitboards in sync with board_state.
+    def set_piece(self, row, col, piece):
+        index = row * 8 + col
+        old_piece = self.board_state[row][col]
+        if old_piece != EMPTY:
+            self.bitboards.remove_piece(old_piece, index)
+            self.zobrist_key ^= PIECE_SQUARE_KEYS[old_piece][index]
+            self.middlegame_score -= MIDDLEGAME_VALUES[old_piece][index]
+            self.endgame_score -= ENDGAME_VALUES[old_piece][index]
+            self.phase -= PIECE_PHASES[old_piece]
+
+            # Only forget a king square if the king is still recorded there, undoing a move can place the king back first.
+            if old_piece == WHITE_KING and self.white_king_square == SQUARE_TO_POS[index]:
+                self.white_king_square = (-1, -1)
+            elif old_piece == BLACK_KING and self.black_king_square == SQUARE_TO_POS[index]:
+                self.black_king_square = (-1, -1)
+
+        self.board_state[row][col] = piece
+        if piece != EMPTY:
+            self.bitboards.add_piece(piece, index)
+            self.zobrist_key ^= PIECE_SQUARE_KEYS[piece][index]
+            self.middlegame_score += MIDDLEGAME_VALUES[piece][index]
+            self.endgame_score += ENDGAME_VALUES[piece][index]
+            self.phase += PIECE_PHASES[piece]
+
+            if piece == WHITE_KING:
+                self.white_king_square = SQUARE_TO_POS[index]
+            elif piece == BLACK_KING:
+                self.black_king_square = SQUARE_TO_POS[index]
 
     # Set up the board state for a new game.
     def setup(self):
         self.clear()
         BoardSetup.setup_standard(self)
         # BoardSetup.setup_stale_mate(self)
+        self._reset_game_state(True)
 
-    # Causes the specific square to not be drawn, used for when drag operations are happening.
-    def hide_square(self, row, col):
-        self.hide_row_index = row
-        self.hide_col_index = col
-
-    # Unhides the hidden square.
-    def unhide_square(self):
-        self.hide_row_index = -1
-        self.hide_col_index = -1
-
-    # Draw the board and pieces.
-    def draw(self, screen, images):
-        BoardRender.draw_board(self, screen)
-        BoardRender.draw_pieces(self, screen, images)
-
-    # Gets the current board square that the mouse cursor is over.
-    def board_index_from_mouse_pos(self):
-        mouse_pos = pygame.mouse.get_pos()
-
-        grid_x = mouse_pos[0] - self.board_start_x
-        grid_y = mouse_pos[1] - self.board_start_y
-
-        clicked_in_grid = True
-
-        if (grid_x < 0 or grid_y < 0):
-            clicked_in_grid = False
-
-        if (grid_x > self.cell_size * 8 or grid_y > self.cell_size * 8):
-            clicked_in_grid = False
-
-        if (clicked_in_grid):
-            col_index = math.floor(grid_x / self.cell_size)
-            row_index = math.floor(grid_y / self.cell_size)
+    # Puts the turn, castling, en-passant, counters and result back to the start of a game, keeping the pieces.
+    def _reset_game_state(self, whites_turn):
+        self.whites_turn = whites_turn
+        self._restore_castling_state(0)
+        self.last_moved_piece = EMPTY
+        self.last_moved_piece_from = (0,0)
+        self.last_moved_piece_to = (0,0)
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        self.move_stack = []
+        self.in_check = False
+        self.result = RESULT_ONGOING
+        self.result_reason = None
+        self.zobrist_key = self.compute_zobrist_key()
+
+    # Sets up a position from a FEN string: piece placement, side to move, castling rights, en-passant target
+    # and the optional halfmove clock and fullmove number. Written for bulk loading, so it fills board_state,
+    # the bitboards, the Zobrist key and the evaluation totals in one pass instead of going through set_piece,
+    # and leaves the game state as ongoing; call update_game_state() to find check, mate and stalemate in the
+    # loaded position. The whole string is parsed and checked before anything is assigned, so an invalid FEN
+    # raises with the board left as it was.
+    def load_fen(self, fen):
+        fields = fen.split()
+        if len(fields) < 4:
+            raise Exception("Invalid FEN string.")
+
+        ranks = fields[0].split("/")
+        if len(ranks) != 8:
+            raise Exception("Invalid FEN string.")
+
+        board_state = [[EMPTY] * 8 for _ in range(8)]
+        pieces = [0] * len(self.bitboards.pieces)
+        key = 0
+        middlegame_score = 0
+        endgame_score = 0
+        phase = 0
+        white_king_square = (-1, -1)
+        black_king_square = (-1, -1)
+
+        for row, rank in enumerate(ranks):
+            row_state = board_state[row]
+            col = 0
+            for char in rank:
+                piece = FEN_PIECES.get(char)
+                if piece is None:
+                    run = FEN_EMPTY_RUNS.get(char)
+                    if run is None or col + run > 8:
+                        raise Exception("Invalid FEN string.")
+                    col += run
+                    continue
 
-            return (row_index, col_index)
-        else:
-            return (-1, -1)
+                if col > 7:
+                    raise Exception("Invalid FEN string.")
+                index = row * 8 + col
+                row_state[col] = piece
+                pieces[piece] |= 1 << index
+                key ^= PIECE_SQUARE_KEYS[piece][index]
+                middlegame_score += MIDDLEGAME_VALUES[piece][index]
+                endgame_score += ENDGAME_VALUES[piece][index]
+                phase += PIECE_PHASES[piece]
+                if piece == WHITE_KING:
+                    white_king_square = SQUARE_TO_POS[index]
+                elif piece == BLACK_KING:
+                    black_king_square = SQUARE_TO_POS[index]
+                col += 1
+
+            if col != 8:
+                raise Exception("Invalid FEN string.")
+
+        if fields[1] != "w" and fields[1] != "b":
+            raise Exception("Invalid FEN string.")
+
+        # Castling rights, dropping any whose king or rook isn't on its home square so a right can never
+        # castle with a piece that isn't there.
+        castling = fields[2]
+        if castling != "-" and (castling.strip("KQkq") or len(set(castling)) != len(castling)):
+            raise Exception("Invalid FEN string.")
+        white_king_home = board_state[7][4] == WHITE_KING
+        black_king_home = board_state[0][4] == BLACK_KING
+        white_king_side = "K" in castling and white_king_home and board_state[7][7] == WHITE_ROOK
+        white_queen_side = "Q" in castling and white_king_home and board_state[7][0] == WHITE_ROOK
+        black_king_side = "k" in castling and black_king_home and board_state[0][7] == BLACK_ROOK
+        black_queen_side = "q" in castling and black_king_home and board_state[0][0] == BLACK_ROOK
+
+        # The en-passant target is recorded as the double pawn push that created it.
+        en_passant = fields[3]
+        last_moved_piece = EMPTY
+        last_moved_piece_from = (0,0)
+        last_moved_piece_to = (0,0)
+        if en_passant != "-":
+            if len(en_passant) != 2 or en_passant[0] not in "abcdefgh" or en_passant[1] not in "36":
+                raise Exception("Invalid FEN string.")
+            col = ord(en_passant[0]) - ord("a")
+            if en_passant[1] == "3":
+                last_moved_piece = WHITE_PAWN
+                last_moved_piece_from = (6, col)
+                last_moved_piece_to = (4, col)
+            else:
+                last_moved_piece = BLACK_PAWN
+                last_moved_piece_from = (1, col)
+                last_moved_piece_to = (3, col)
+
+        # Everything is valid, so the board can be updated. The rows are filled in place, other code can hold them.
+        for row, row_state in enumerate(board_state):
+            self.board_state[row][:] = row_state
+
+        bitboards = self.bitboards
+        bitboards.pieces[:] = pieces
+        bitboards.white = pieces[WHITE_PAWN] | pieces[WHITE_KNIGHT] | pieces[WHITE_BISHOP] | pieces[WHITE_ROOK] | pieces[WHITE_QUEEN] | pieces[WHITE_KING]
+        bitboards.black = pieces[BLACK_PAWN] | pieces[BLACK_KNIGHT] | pieces[BLACK_BISHOP] | pieces[BLACK_ROOK] | pieces[BLACK_QUEEN] | pieces[BLACK_KING]
+        bitboards.occupied = bitboards.white | bitboards.black
+        self.white_king_square = white_king_square
+        self.black_king_square = black_king_square
+        self.middlegame_score = middlegame_score
+        self.endgame_score = endgame_score
+        self.phase = phase
+
+        self.whites_turn = fields[1] == "w"
+
+        # Castling rights map back on to the moved flags the board tracks.
+        self.white_king_moved = not white_king_side and not white_queen_side
+        self.black_king_moved = not black_king_side and not black_queen_side
+        self.white_king_side_rook_moved = not white_king_side
+        self.white_queen_side_rook_moved = not white_queen_side
+        self.black_king_side_rook_moved = not black_king_side
+        self.black_queen_side_rook_moved = not black_queen_side
+
+        self.last_moved_piece = last_moved_piece
+        self.last_moved_piece_from = last_moved_piece_from
+        self.last_moved_piece_to = last_moved_piece_to
+
+        # The counters are often left off EPD style strings.
+        self.halfmove_clock = int(fields[4]) if len(fields) > 4 and fields[4].isdigit() else 0
+        self.fullmove_number = int(fields[5]) if len(fields) > 5 and fields[5].isdigit() else 1
+
+        self.move_stack = []
+        self.in_check = False
+        self.result = RESULT_ONGOING
+        self.result_reason = None
+        self.zobrist_key = key ^ self._zobrist_state_key()
+
+    # The position as a FEN string. The en-passant target is written after every double pawn push, as the
+    # FEN standard has it, whether or not a pawn is there to take it.
+    def to_fen(self):
+        ranks = []
+        for row_state in self.board_state:
+            rank = ""
+            run = 0
+            for piece in row_state:
+                if piece == EMPTY:
+                    run += 1
+                    continue
+                if run:
+                    rank += str(run)
+                    run = 0
+                rank += FEN_LETTERS[piece]
+            if run:
+                rank += str(run)
+            ranks.append(rank)
+
+        rights = self._castling_rights()
+        castling = "".join(letter for bit, letter in enumerate("KQkq") if rights & (1 << bit)) or "-"
+
+        en_passant = "-"
+        piece = self.last_moved_piece
+        if ((piece == WHITE_PAWN or piece == BLACK_PAWN) and
+            abs(self.last_moved_piece_from[0] - self.last_moved_piece_to[0]) == 2):
+            row = (self.last_moved_piece_from[0] + self.last_moved_piece_to[0]) // 2
+            en_passant = "abcdefgh"[self.last_moved_piece_to[1]] + str(8 - row)
+
+        return "{} {} {} {} {} {}".format("/".join(ranks), "w" if self.whites_turn else "b", castling, en_passant,
+            self.halfmove_clock, self.fullmove_number)
 
     def is_piece_on_square(self, row, col):
-        return self.board_state[row][col] != Piece.NONE
-
-    def start_drag(self, row, col):
-        self.hide_square(row, col)
-        self.start_drag_square = row, col
-        self.dragging_piece = self.board_state[row][col]
-
-    def stop_drag(self):
-        self.unhide_square()
-        self.dragging_piece = Piece.NONE
+        return (self.bitboards.occupied >> (row * 8 + col)) & 1 == 1
 
     # When a piece has been dragged, and its the correct players turn, the piece movement
     # on the board needs to be validated.
-    def perform_move(self, end_square):
+    def perform_move(self, start_square, end_square, promotion = EMPTY):
+        return self.play_move((start_square, end_square, promotion))
+
+    # Plays a move for the side to move if it is legal, then updates the check and result state.
+    # A pawn reaching the last rank becomes a queen unless another promotion piece is given.
+    def play_move(self, move):
         result = MoveResult()
+        start_square, end_square, promotion = move
+        piece = self.board_state[start_square[0]][start_square[1]]
+        whites_turn = self.whites_turn
 
-        if self.dragging_piece == Piece.NONE:
-            result.move_performed = False
+        # Only the side to move can move, and only while the game is still going.
+        if piece == EMPTY or (piece & BLACK == 0) != whites_turn or self.result != RESULT_ONGOING:
             return result
-        
-        start_square = self.start_drag_square
-        piece = self.dragging_piece
-        whites_turn = Piece.is_white_piece(piece)
 
         moves = PieceMoves.get_moves_for_piece(self, piece, start_square)
-        move_allowed = end_square in moves
-
-        if not move_allowed:
-            result.move_performed = False
+        if end_square not in moves:
             return result
 
-        result.move_performed = True
-             
-        # Are we about to perform en-passant?
-        en_passant_movement = self._is_en_passant_movement(piece, start_square, end_square)
-
-        # Perform the piece move.
-        self.board_state[start_square[0]][start_square[1]] = Piece.NONE
-        self.board_state[end_square[0]][end_square[1]] = piece
-
-        if en_passant_movement:
-            # Capture the pawn we just moved behind.
-            if piece == Piece.WHITE_PAWN:
-                self.board_state[end_square[0]+1][end_square[1]] = Piece.NONE
-            else:
-                self.board_state[end_square[0]-1][end_square[1]] = Piece.NONE
-
-        # Did we just castle? If so, move the rooks.
-        if (piece == Piece.WHITE_KING and
-            start_square[0] == 7 and start_square[1] == 4 and
-            end_square[0] == 7 and end_square[1] == 6):
-            # White king side castle.
-            self.board_state[7][7] = Piece.NONE
-            self.board_state[7][5] = Piece.WHITE_ROOK
-
-        if (piece == Piece.WHITE_KING and
-            start_square[0] == 7 and start_square[1] == 4 and
-            end_square[0] == 7 and end_square[1] == 2):
-            # White queen side castle.
-            self.board_state[7][0] = Piece.NONE
-            self.board_state[7][3] = Piece.WHITE_ROOK
-
-        if (piece == Piece.BLACK_KING and
-            start_square[0] == 0 and start_square[1] == 4 and
-            end_square[0] == 0 and end_square[1] == 6):
-            # White king side castle.
-            self.board_state[0][7] = Piece.NONE
-            self.board_state[0][5] = Piece.BLACK_ROOK
-
-        if (piece == Piece.BLACK_KING and
-            start_square[0] == 0 and start_square[1] == 4 and
-            end_square[0] == 0 and end_square[1] == 2):
-            # White queen side castle.
-            self.board_state[0][0] = Piece.NONE
-            self.board_state[0][3] = Piece.BLACK_ROOK
-       
-        # Check if we put ourselves in check.
-        if self._is_player_in_check(self.board_state, whites_turn):
-            # Undo the move.
-            self.board_state[start_square[0]][start_square[1]] = piece
-            self.board_state[end_square[0]][end_square[1]] = Piece.NONE
-
-            # Undo en-passant capture.
-            if en_passant_movement:
-                if piece == Piece.WHITE_PAWN:
-                    self.board_state[end_square[0]+1][end_square[1]] = Piece.BLACK_PAWN
-                else:
-                    self.board_state[end_square[0]-1][end_square[1]] = Piece.WHITE_PAWN
+        # Did a pawn make it to the last rank for promotion?
+        if ((piece == WHITE_PAWN and end_square[0] == 0) or
+            (piece == BLACK_PAWN and end_square[0] == 7)):
+            promotion_pieces = PROMOTION_PIECES_WHITE if whites_turn else PROMOTION_PIECES_BLACK
+            if promotion == EMPTY:
+                promotion = promotion_pieces[0]
+            elif promotion not in promotion_pieces:
+                return result
+            result.promote_available = True
+            result.promote_position = end_square
+        elif promotion != EMPTY:
+            return result
 
-            result.move_performed = False
+        # The piece can move there, but not if it leaves our own king in check.
+        move = (start_square, end_square, promotion)
+        if move not in self.generate_legal_moves():
+            result.promote_available = False
             result.move_denied_self_check = True
             return result
-        
-        # Have we checked the opponent?
-        if self._is_player_in_check(self.board_state, not whites_turn):
-            result.opponent_now_in_check = True
 
-            # Have we check mated / stale mated?
-            if self._is_player_in_check_mate(not whites_turn):
-                result.opponent_check_mate = True
+        self.make_move(move)
+        result.move_performed = True
+        self.update_game_state()
 
-        # Is the opponent in stale mate?
-        result.opponent_stale_mate = self._is_stale_mate(whites_turn)
+        # Have we checked, check mated or stale mated the opponent?
+        result.opponent_now_in_check = self.in_check
+        result.opponent_check_mate = self.result_reason == CHECKMATE
+        result.opponent_stale_mate = self.result_reason == STALEMATE
 
-        # Record this move.
-        self.last_moved_piece = piece
-        self.last_moved_piece_from = start_square
+        return result
 
-        # Did we move the kings?
-        if piece == Piece.WHITE_KING:
+    # Works out check and the result for the side to move.
+    def update_game_state(self):
+        whites_turn = self.whites_turn
+        self.in_check = self._is_player_in_check(self.board_state, whites_turn)
+        self.result = RESULT_ONGOING
+        self.result_reason = None
+
+        if not self.has_legal_move(whites_turn):
+            if self.in_check:
+                self.result = RESULT_BLACK_WINS if whites_turn else RESULT_WHITE_WINS
+                self.result_reason = CHECKMATE
+            else:
+                self.result = RESULT_DRAW
+                self.result_reason = STALEMATE
+        elif self.halfmove_clock >= 100:
+            self.result = RESULT_DRAW
+            self.result_reason = FIFTY_MOVE_RULE
+
+    '''
+    Moves for generate_legal_moves/make_move are (start_square, end_square, promotion) tuples, where
+    promotion is the piece a pawn turns into on the last rank and EMPTY for every other move.
+    The search uses generate_moves/make_move_code instead, with the packed int moves from move.py.
+    '''
+
+    # Returns every legal move for the side to move.
+    def generate_legal_moves(self):
+        buffer = self.move_buffer
+        white = self.whites_turn
+        return [Move.to_tuple(buffer[i], white) for i in range(self.generate_moves(buffer))]
+
+    # Fills buffer (a list of at least MAX_MOVES) with every legal move for the side to move as packed
+    # ints, and returns how many there are. Nothing is allocated per move.
+    # Only legal moves are generated: the checks and pins are worked out once (see has_legal_move for the
+    # rules they follow), so the only moves still tried on the board are en-passant captures, and the only
+    # squares tested for attacks are the king's.
+    def generate_moves(self, buffer):
+        white = self.whites_turn
+        bitboards = self.bitboards
+        pieces = bitboards.pieces
+        own_pieces = bitboards.side(white)
+        enemy_pieces = bitboards.side(not white)
+        occupied = bitboards.occupied
+        colour = 0 if white else BLACK
+        pawn_colour = 0 if white else 1
+        capture = CAPTURE << 12
+        count = 0
+
+        checkers, pinned, pin_rays = self._checks_and_pins(white)
+
+        king_square = self.white_king_square if white else self.black_king_square
+        if king_square[0] != -1:
+            king_index = king_square[0] * 8 + king_square[1]
+            without_king = occupied ^ SQUARE_BITS[king_index]
+            for index in Bitboards.indexes(KING_ATTACKS[king_index] & ~own_pieces):
+                if not self.is_square_attacked(SQUARE_TO_POS[index], not white, without_king):
+                    buffer[count] = king_index | index << 6 | (capture if enemy_pieces >> index & 1 else 0)
+                    count += 1
+
+            if checkers & (checkers - 1):
+                return count
+
+            if not checkers:
+                count = self._castling_moves(buffer, count, white, king_index)
+
+        targets = ~own_pieces
+        if checkers:
+            targets &= checkers | BETWEEN[king_index][checkers.bit_length() - 1]
+
+        for index in Bitboards.indexes(pieces[colour | KNIGHT] & ~pinned):
+            for end_index in Bitboards.indexes(KNIGHT_ATTACKS[index] & targets):
+                buffer[count] = index | end_index << 6 | (capture if enemy_pieces >> end_index & 1 else 0)
+                count += 1
+
+        for piece_type, attacks in ((BISHOP, bishop_attacks), (ROOK, rook_attacks), (QUEEN, queen_attacks)):
+            for index in Bitboards.indexes(pieces[colour | piece_type]):
+                moves = attacks(index, occupied) & targets
+                if pinned & SQUARE_BITS[index]:
+                    moves &= pin_rays[index]
+                for end_index in Bitboards.indexes(moves):
+                    buffer[count] = index | end_index << 6 | (capture if enemy_pieces >> end_index & 1 else 0)
+                    count += 1
+
+        empty = ~occupied
+        # Square indexes on the last rank are 0-7 for white and 56-63 for black.
+        promotion_rank = 0 if white else 7
+        for index in Bitboards.indexes(pieces[colour | PAWN]):
+            moves = PAWN_ATTACKS[pawn_colour][index] & enemy_pieces
+            push = PAWN_PUSHES[pawn_colour][index] & empty
+            double_push = 0
+            if push:
+                double_push = PAWN_DOUBLE_PUSHES[pawn_colour][index] & empty
+                moves |= push | double_push
+            moves &= targets
+            if pinned & SQUARE_BITS[index]:
+                moves &= pin_rays[index]
+            for end_index in Bitboards.indexes(moves):
+                flags = capture if enemy_pieces >> end_index & 1 else 0
+                if end_index >> 3 == promotion_rank:
+                    # Queen first, the same order as PROMOTION_PIECES_WHITE/BLACK.
+                    move = index | end_index << 6 | flags | PROMOTION << 12
+                    buffer[count] = move | 3 << 12
+                    buffer[count + 1] = move | 2 << 12
+                    buffer[count + 2] = move | 1 << 12
+                    buffer[count + 3] = move
+                    count += 4
+                else:
+                    if double_push >> end_index & 1:
+                        flags = DOUBLE_PAWN_PUSH << 12
+                    buffer[count] = index | end_index << 6 | flags
+                    count += 1
+
+        for move in self._legal_en_passant_moves(white):
+            buffer[count] = move
+            count += 1
+        return count
+
+    # Adds the castling moves open to the player to buffer from position count and returns the new count.
+    # The caller has already made sure the king isn't in check.
+    def _castling_moves(self, buffer, count, white, king_index):
+        row = 7 if white else 0
+        if king_index != row * 8 + 4 or (self.white_king_moved if white else self.black_king_moved):
+            return count
+
+        state = self.board_state[row]
+        if (not (self.white_king_side_rook_moved if white else self.black_king_side_rook_moved) and
+            state[5] == EMPTY and state[6] == EMPTY and
+            not self.is_square_attacked((row, 5), not white) and
+            not self.is_square_attacked((row, 6), not white)):
+            buffer[count] = Move.encode(king_index, king_index + 2, KING_CASTLE)
+            count += 1
+
+        if (not (self.white_queen_side_rook_moved if white else self.black_queen_side_rook_moved) and
+            state[1] == EMPTY and state[2] == EMPTY and state[3] == EMPTY and
+            not self.is_square_attacked((row, 2), not white) and
+            not self.is_square_attacked((row, 3), not white)):
+            buffer[count] = Move.encode(king_index, king_index - 2, QUEEN_CASTLE)
+            count += 1
+
+        return count
+
+    # Applies a move without any legality checks and records how to undo it.
+    def make_move(self, move):
+        self._make_move(move[0], move[1], move[2])
+
+    # make_move for a packed int move from generate_moves.
+    def make_move_code(self, move):
+        promotion = EMPTY
+        if move >> 12 & PROMOTION:
+            promotion = (0 if self.whites_turn else BLACK) | PROMOTION_TYPES[move >> 12 & 3]
+        self._make_move(SQUARE_TO_POS[move & 63], SQUARE_TO_POS[move >> 6 & 63], promotion)
+
+    def _make_move(self, start_square, end_square, promotion):
+        piece = self.board_state[start_square[0]][start_square[1]]
+
+        captured_square = end_square
+        if self._is_en_passant_movement(piece, start_square, end_square):
+            # The captured pawn sits beside the start square, behind the end square.
+            captured_square = (start_square[0], end_square[1])
+        captured_piece = self.board_state[captured_square[0]][captured_square[1]]
+
+        self.move_stack.append((start_square, end_square, promotion, piece, captured_piece, captured_square, self._castling_state(),
+            self.last_moved_piece, self.last_moved_piece_from, self.last_moved_piece_to, self.zobrist_key,
+            self.halfmove_clock))
+
+        # Take the castling, en-passant and side to move keys out now and put the new ones back in at the end.
+        # The piece keys are handled by set_piece.
+        self.zobrist_key ^= self._zobrist_state_key()
+
+        if captured_square != end_square:
+            self.set_piece(captured_square[0], captured_square[1], EMPTY)
+        self.set_piece(start_square[0], start_square[1], EMPTY)
+        self.set_piece(end_square[0], end_square[1], piece if promotion == EMPTY else promotion)
+
+        if piece == WHITE_KING:
             self.white_king_moved = True
-        if piece == Piece.BLACK_KING:
+        elif piece == BLACK_KING:
             self.black_king_moved = True
 
-        # Did we move the rooks?
-        if start_square[0] == 7 and start_square[1] == 0:
+        # Did we just castle? If so, move the rook too.
+        if (piece == WHITE_KING or piece == BLACK_KING) and abs(end_square[1] - start_square[1]) == 2:
+            row = start_square[0]
+            if end_square[1] == 6:
+                self.set_piece(row, 5, self.board_state[row][7])
+                self.set_piece(row, 7, EMPTY)
+            else:
+                self.set_piece(row, 3, self.board_state[row][0])
+                self.set_piece(row, 0, EMPTY)
+
+        # A rook leaving its corner, or being captured there, loses its castling right.
+        self._update_rook_moved(start_square)
+        self._update_rook_moved(end_square)
+
+        self.last_moved_piece = piece
+        self.last_moved_piece_from = start_square
+        self.last_moved_piece_to = end_square
+
+        if piece == WHITE_PAWN or piece == BLACK_PAWN or captured_piece != EMPTY:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if not self.whites_turn:
+            self.fullmove_number += 1
+
+        self.whites_turn = not self.whites_turn
+        self.zobrist_key ^= self._zobrist_state_key()
+
+    # Reverts the last move applied by make_move.
+    def unmake_move(self):
+        (start_square, end_square, promotion, piece, captured_piece, captured_square, castling_state,
+            last_moved_piece, last_moved_piece_from, last_moved_piece_to, zobrist_key, halfmove_clock) = self.move_stack.pop()
+
+        self.set_piece(end_square[0], end_square[1], EMPTY)
+        self.set_piece(start_square[0], start_square[1], piece)
+        if captured_piece != EMPTY:
+            self.set_piece(captured_square[0], captured_square[1], captured_piece)
+
+        # Put a castled rook back in its corner.
+        if (piece == WHITE_KING or piece == BLACK_KING) and abs(end_square[1] - start_square[1]) == 2:
+            row = start_square[0]
+            if end_square[1] == 6:
+                self.set_piece(row, 7, self.board_state[row][5])
+                self.set_piece(row, 5, EMPTY)
+            else:
+                self.set_piece(row, 0, self.board_state[row][3])
+                self.set_piece(row, 3, EMPTY)
+
+        self._restore_castling_state(castling_state)
+        self.last_moved_piece = last_moved_piece
+        self.last_moved_piece_from = last_moved_piece_from
+        self.last_moved_piece_to = last_moved_piece_to
+        self.whites_turn = not self.whites_turn
+        self.zobrist_key = zobrist_key
+        self.halfmove_clock = halfmove_clock
+        if not self.whites_turn:
+            self.fullmove_number -= 1
+
+    def _update_rook_moved(self, square):
+        if square[0] == 7 and square[1] == 0:
             self.white_queen_side_rook_moved = True
-        if start_square[0] == 7 and start_square[1] == 7:
+        elif square[0] == 7 and square[1] == 7:
             self.white_king_side_rook_moved = True
-        if start_square[0] == 0 and start_square[1] == 0:
+        elif square[0] == 0 and square[1] == 0:
             self.black_queen_side_rook_moved = True
-        if start_square[0] == 0 and start_square[1] == 7:
+        elif square[0] == 0 and square[1] == 7:
             self.black_king_side_rook_moved = True
 
-        # Did a pawn make it to the last rank for promotion?
-        if ((piece == Piece.WHITE_PAWN and end_square[0] == 0) or
-            (piece == Piece.BLACK_PAWN and end_square[0] == 7)):
-            result.promote_available = True
-            result.promote_position = end_square
-       
-        return result
+    # Packs the six castling flags into one int for the undo records.
+    def _castling_state(self):
+        return (self.white_king_moved |
+            self.black_king_moved << 1 |
+            self.white_king_side_rook_moved << 2 |
+            self.white_queen_side_rook_moved << 3 |
+            self.black_king_side_rook_moved << 4 |
+            self.black_queen_side_rook_moved << 5)
+
+    def _restore_castling_state(self, state):
+        self.white_king_moved = state & 1 != 0
+        self.black_king_moved = state & 2 != 0
+        self.white_king_side_rook_moved = state & 4 != 0
+        self.white_queen_side_rook_moved = state & 8 != 0
+        self.black_king_side_rook_moved = state & 16 != 0
+        self.black_queen_side_rook_moved = state & 32 != 0
+
+    # Packs the rules state into ENCODED_SIZE bytes: the 64 squares two to a byte, then the side to move, the castling
+    # flags, the last move (for en-passant) and the move counters. Used to hand positions to other processes without pickling the whole
+    # Board along with its move stack, buffers and cached state.
+    def encode(self):
+        data = bytearray(ENCODED_SIZE)
+        state = self.board_state
+        for index in range(0, 64, 2):
+            data[index >> 1] = state[index >> 3][index & 7] | state[index >> 3][(index & 7) + 1] << 4
+        data[32] = self.whites_turn
+        data[33] = self._castling_state()
+        data[34] = self.last_moved_piece
+        data[35] = self.last_moved_piece_from[0] * 8 + self.last_moved_piece_from[1]
+        data[36] = self.last_moved_piece_to[0] * 8 + self.last_moved_piece_to[1]
+        data[37] = min(self.halfmove_clock, 255)
+        data[38:40] = min(self.fullmove_number, 65535).to_bytes(2, "little")
+        return bytes(data)
+
+    # Loads a position made by encode(). The undo history isn't encoded, so it starts empty, and like load_fen it
+    # leaves the game state as ongoing; call update_game_state() to find check, mate and stalemate.
+    def decode(self, data):
+        self.clear()
+        for index in range(0, 64, 2):
+            pair = data[index >> 1]
+            if pair & 15:
+                self.set_piece(index >> 3, index & 7, pair & 15)
+            if pair >> 4:
+                self.set_piece(index >> 3, (index & 7) + 1, pair >> 4)
+        self.whites_turn = data[32] != 0
+        self._restore_castling_state(data[33])
+        self.last_moved_piece = data[34]
+        self.last_moved_piece_from = SQUARE_TO_POS[data[35]]
+        self.last_moved_piece_to = SQUARE_TO_POS[data[36]]
+        self.halfmove_clock = data[37]
+        self.fullmove_number = int.from_bytes(data[38:40], "little")
+        self.move_stack = []
+        self.in_check = False
+        self.result = RESULT_ONGOING
+        self.result_reason = None
+        self.zobrist_key = self.compute_zobrist_key()
+
+    # Computes the Zobrist key from scratch. Only needed after the state is set up directly (e.g. from a FEN),
+    # moves keep zobrist_key up to date incrementally.
+    def compute_zobrist_key(self):
+        key = self._zobrist_state_key()
+        for index in Bitboards.indexes(self.bitboards.occupied):
+            key ^= PIECE_SQUARE_KEYS[self.board_state[index // 8][index % 8]][index]
+        return key
+
+    # The part of the Zobrist key that isn't piece placement: castling rights, en-passant file and side to move.
+    def _zobrist_state_key(self):
+        key = CASTLING_KEYS[self._castling_rights()]
+
+        en_passant_file = self._en_passant_file()
+        if en_passant_file != -1:
+            key ^= EN_PASSANT_KEYS[en_passant_file]
+
+        if not self.whites_turn:
+            key ^= BLACK_TO_MOVE_KEY
+
+        return key
+
+    # Castling rights as 4 bits: white king side, white queen side, black king side, black queen side.
+    def _castling_rights(self):
+        rights = 0
+        if not self.white_king_moved:
+            if not self.white_king_side_rook_moved:
+                rights |= 1
+            if not self.white_queen_side_rook_moved:
+                rights |= 2
+        if not self.black_king_moved:
+            if not self.black_king_side_rook_moved:
+                rights |= 4
+            if not self.black_queen_side_rook_moved:
+                rights |= 8
+        return rights
+
+    # The file of a pawn that just made a double step and has an enemy pawn beside it to capture it
+    # en-passant, otherwise -1. Positions that can't actually capture hash the same as if no double step happened.
+    def _en_passant_file(self):
+        piece = self.last_moved_piece
+        if piece == WHITE_PAWN:
+            if self.last_moved_piece_from[0] != 6 or self.last_moved_piece_to[0] != 4:
+                return -1
+            enemy_pawn = BLACK_PAWN
+        elif piece == BLACK_PAWN:
+            if self.last_moved_piece_from[0] != 1 or self.last_moved_piece_to[0] != 3:
+                return -1
+            enemy_pawn = WHITE_PAWN
+        else:
+            return -1
+
+        row, col = self.last_moved_piece_to
+        if ((col > 0 and self.board_state[row][col-1] == enemy_pawn) or
+            (col < 7 and self.board_state[row][col+1] == enemy_pawn)):
+            return col
+        return -1
 
     # Returns true if the specified pawn movement is detected as being en-passant.
     def _is_en_passant_movement(self, piece, start_square, end_square):
         # We detect this by seeing if the pawn has been allowed to capture an empty square.
         # White pawns left diagonal check.
-        if piece == Piece.WHITE_PAWN:
+        if piece == WHITE_PAWN:
             if end_square[1] == start_square[1]-1 and end_square[0] == start_square[0]-1:
-                if self.board_state[end_square[0]][end_square[1]] == Piece.NONE:
+                if self.board_state[end_square[0]][end_square[1]] == EMPTY:
                     return True
 
         # White pawns right diagonal check.
-        if piece == Piece.WHITE_PAWN:
+        if piece == WHITE_PAWN:
             if end_square[1] == start_square[1]+1 and end_square[0] == start_square[0]-1:
-                if self.board_state[end_square[0]][end_square[1]] == Piece.NONE:
+                if self.board_state[end_square[0]][end_square[1]] == EMPTY:
                     return True
 
         # Black pawns left diagonal check.
-        if piece == Piece.BLACK_PAWN:
+        if piece == BLACK_PAWN:
             if end_square[1] == start_square[1]-1 and end_square[0] == start_square[0]+1:
-                if self.board_state[end_square[0]][end_square[1]] == Piece.NONE:
+                if self.board_state[end_square[0]][end_square[1]] == EMPTY:
                     return True
 
         # Black pawns right diagonal check.
-        if piece == Piece.BLACK_PAWN:
+        if piece == BLACK_PAWN:
             if end_square[1] == start_square[1]+1 and end_square[0] == start_square[0]+1:
-                if self.board_state[end_square[0]][end_square[1]] == Piece.NONE:
+                if self.board_state[end_square[0]][end_square[1]] == EMPTY:
                     return True
 
         return False
 
-    # Find the king and return his coordinates.
+    # Return the king's coordinates.
     def _find_king(self, board, white):
-        found = False
-        for row in range(0, 8):
-            for col in range(0, 8):
-                if board[row][col] == Piece.WHITE_KING if white else board[row][col] == Piece.BLACK_KING:
-                    found = True
-                    break
-            if found:
-                break
-
-        return row, col
+        return self.white_king_square if white else self.black_king_square
         
     def _is_player_in_check(self, board, white):
-        king = self._find_king(board, white)
-
-        king_row = king[0]
-        king_col = king[1]
-
-        # Let's traverse all the pieces to check for check.
-        for row in range(0, 8):
-            for col in range(0, 8):
-                check_piece = False
-                piece = board[row][col]
-                
-                if piece == Piece.NONE:
-                    continue
-
-                if white:
-                    check_piece = Piece.is_black_piece(piece)
-                else:
-                    check_piece = Piece.is_white_piece(piece)
-
-                if not check_piece:
-                    continue
-
-                moves = PieceMoves.get_moves_for_piece(self, piece, (row, col))
+        king = self.white_king_square if white else self.black_king_square
+
+        # No king on the board (e.g. a partial setup), so nothing can be in check.
+        if king[0] == -1:
+            return False
+
+        return self.is_square_attacked(king, not white)
+
+    # Returns true if any piece of the attacking colour attacks the square.
+    # Rather than generating every enemy move, this looks outward from the target square: a knight
+    # jump, pawn capture, king step or slider ray from the target that lands on a matching enemy
+    # piece means that piece attacks the target. The cheapest tests run first and the first hit returns.
+    # occupied overrides the board occupancy for the slider rays, e.g. to test a square with the king lifted off.
+    def is_square_attacked(self, square, white_attacking, occupied = None):
+        index = square[0] * 8 + square[1]
+        pieces = self.bitboards.pieces
+
+        if white_attacking:
+            # A white pawn attacks this square from where a black pawn on this square would capture.
+            if PAWN_ATTACKS[1][index] & pieces[WHITE_PAWN]:
+                return True
+            if KNIGHT_ATTACKS[index] & pieces[WHITE_KNIGHT]:
+                return True
+            if KING_ATTACKS[index] & pieces[WHITE_KING]:
+                return True
+            queens = pieces[WHITE_QUEEN]
+            diagonal_attackers = pieces[WHITE_BISHOP] | queens
+            straight_attackers = pieces[WHITE_ROOK] | queens
+        else:
+            if PAWN_ATTACKS[0][index] & pieces[BLACK_PAWN]:
+                return True
+            if KNIGHT_ATTACKS[index] & pieces[BLACK_KNIGHT]:
+                return True
+            if KING_ATTACKS[index] & pieces[BLACK_KING]:
+                return True
+            queens = pieces[BLACK_QUEEN]
+            diagonal_attackers = pieces[BLACK_BISHOP] | queens
+            straight_attackers = pieces[BLACK_ROOK] | queens
+
+        # Slider rays from the target stop at the first piece they hit, so only an unblocked slider matches.
+        if occupied is None:
+            occupied = self.bitboards.occupied
+        if diagonal_attackers and bishop_attacks(index, occupied) & diagonal_attackers:
+            return True
+        if straight_attackers and rook_attacks(index, occupied) & straight_attackers:
+            return True
 
-                if (king_row, king_col) in moves:
-                    return True
+        return False
 
+    # Returns true if the player is in check mate (assumes the king is already in check).
     def _is_player_in_check_mate(self, white):
-        # For each piece, see if we can we save the king (we're assuming the king is already in check here).
-        for row in range(0, 8):
-            for col in range(0, 8):
-                check_piece = False
-                piece = self.board_state[row][col]
-                
-                if piece == Piece.NONE:
-                    continue
-
-                if white:
-                    check_piece = Piece.is_white_piece(piece)
-                else:
-                    check_piece = Piece.is_black_piece(piece)
-
-                if not check_piece:
-                    continue
-
-                moves = PieceMoves.get_moves_for_piece(self, piece, (row, col))
+        return not self.has_legal_move(white)
 
-                # Move this piece in to all of its availble positions seeing if it saves the king at each move.
-                for move in moves:
-                    # Move the piece.
-                    piece_at_target = self.board_state[move[0]][move[1]]
-                    self.board_state[row][col] = Piece.NONE
-                    self.board_state[move[0]][move[1]] = piece
-
-                    if not self._is_player_in_check(self.board_state, white):
-                        # Undo the move.
-                        self.board_state[row][col] = piece
-                        self.board_state[move[0]][move[1]] = piece_at_target
-
-                        # We can get out of check with this move
-                        return False
-                    else:
-                        # Undo the move, carry on and keep trying.
-                        self.board_state[row][col] = piece
-                        self.board_state[move[0]][move[1]] = piece_at_target
-
-        # Failed to get out of the check state, we are truly in check mate here.
-        return True
-
-    # Returns true if the opponent is now in stale mate.
+    # Returns true if the opponent of the player that just moved has no legal move.
     def _is_stale_mate(self, whites_turn):
-        for row in range(0, 8):
-            for col in range(0, 8):
-
-                piece = self.board_state[row][col]
-                if piece == Piece.NONE:
-                    continue
-                if whites_turn and Piece.is_white_piece(piece):
-                    continue
-                if not whites_turn and Piece.is_black_piece(piece):
-                    continue
+        return not self.has_legal_move(not whites_turn)
+
+    # Returns true as soon as one legal move is found for the player, which is all checkmate and
+    # stalemate need to know. The pins and checks are worked out once up front, so apart from
+    # en-passant no move has to be tried on the board:
+    # - the king can step to any square that isn't attacked once it has left its own square;
+    # - in double check nothing else can move;
+    # - in single check other pieces have to capture the checker or block its ray;
+    # - a pinned piece can only move along the line between its king and the pinning piece.
+    # Castling never needs testing, because a legal castle means the king can step towards the rook too.
+    def has_legal_move(self, white):
+        bitboards = self.bitboards
+        pieces = bitboards.pieces
+        own_pieces = bitboards.side(white)
+        enemy_pieces = bitboards.side(not white)
+        occupied = bitboards.occupied
+        colour = 0 if white else BLACK
+        pawn_colour = 0 if white else 1
+
+        checkers, pinned, pin_rays = self._checks_and_pins(white)
+
+        king_square = self.white_king_square if white else self.black_king_square
+        if king_square[0] != -1:
+            king_index = king_square[0] * 8 + king_square[1]
+            without_king = occupied ^ SQUARE_BITS[king_index]
+            for index in Bitboards.indexes(KING_ATTACKS[king_index] & ~own_pieces):
+                if not self.is_square_attacked(SQUARE_TO_POS[index], not white, without_king):
+                    return True
 
-                moves = PieceMoves.get_moves_for_piece(self, piece, (row, col))
-                    
-                # We need to see if we can move in to these available movements without causing a check.
-                for move in moves:
-                    target_piece = self.board_state[move[0]][move[1]]
+            if checkers & (checkers - 1):
+                return False
 
-                    # Lets sim the move.
-                    self.board_state[row][col] = Piece.NONE
-                    self.board_state[move[0]][move[1]] = piece
+        # Squares a move has to land on: anywhere, or on the single checker or between it and the king.
+        targets = ~own_pieces
+        if checkers:
+            targets &= checkers | BETWEEN[king_index][checkers.bit_length() - 1]
 
-                    # Does it result in a check?
-                    if not self._is_player_in_check(self.board_state, not whites_turn):
-                        # Undo the move.
-                        self.board_state[row][col] = piece
-                        self.board_state[move[0]][move[1]] = target_piece
-                        return False
+        for index in Bitboards.indexes(pieces[colour | KNIGHT] & ~pinned):
+            if KNIGHT_ATTACKS[index] & targets:
+                return True
 
-                    # Undo the move.
-                    self.board_state[row][col] = piece
-                    self.board_state[move[0]][move[1]] = target_piece
+        for piece_type, attacks in ((BISHOP, bishop_attacks), (ROOK, rook_attacks), (QUEEN, queen_attacks)):
+            for index in Bitboards.indexes(pieces[colour | piece_type]):
+                moves = attacks(index, occupied) & targets
+                if moves and pinned & SQUARE_BITS[index]:
+                    moves &= pin_rays[index]
+                if moves:
+                    return True
 
-        return True
+        empty = ~occupied
+        for index in Bitboards.indexes(pieces[colour | PAWN]):
+            moves = PAWN_ATTACKS[pawn_colour][index] & enemy_pieces
+            push = PAWN_PUSHES[pawn_colour][index] & empty
+            if push:
+                moves |= push | (PAWN_DOUBLE_PUSHES[pawn_colour][index] & empty)
+            moves &= targets
+            if moves and pinned & SQUARE_BITS[index]:
+                moves &= pin_rays[index]
+            if moves:
+                return True
+
+        return len(self._legal_en_passant_moves(white)) > 0
+
+    # Works out the pieces giving check to the player's king, and the player's pieces that are pinned to it.
+    # Returns (checkers, pinned, pin_rays): two bitboards, and for each pinned piece's square index the
+    # squares it may still move to (the line up to and including the pinning piece).
+    def _checks_and_pins(self, white):
+        king_square = self.white_king_square if white else self.black_king_square
+        if king_square[0] == -1:
+            return 0, 0, {}
+
+        bitboards = self.bitboards
+        pieces = bitboards.pieces
+        enemy = BLACK if white else 0
+        own_pieces = bitboards.side(white)
+        enemy_pieces = bitboards.side(not white)
+        occupied = bitboards.occupied
+        king_index = king_square[0] * 8 + king_square[1]
+
+        straight = pieces[enemy | ROOK] | pieces[enemy | QUEEN]
+        diagonal = pieces[enemy | BISHOP] | pieces[enemy | QUEEN]
+
+        checkers = ((KNIGHT_ATTACKS[king_index] & pieces[enemy | KNIGHT]) |
+            (PAWN_ATTACKS[0 if white else 1][king_index] & pieces[enemy | PAWN]) |
+            (rook_attacks(king_index, occupied) & straight) |
+            (bishop_attacks(king_index, occupied) & diagonal))
+
+        # Sliders that would reach the king if our own pieces weren't in the way. With exactly one of our
+        # pieces between, that piece is pinned.
+        snipers = (rook_attacks(king_index, enemy_pieces) & straight) | (bishop_attacks(king_index, enemy_pieces) & diagonal)
+        pinned = 0
+        pin_rays = {}
+        for sniper in Bitboards.indexes(snipers):
+            between = BETWEEN[king_index][sniper]
+            blockers = between & occupied
+            if blockers and not blockers & (blockers - 1) and blockers & own_pieces:
+                pinned |= blockers
+                pin_rays[blockers.bit_length() - 1] = between | SQUARE_BITS[sniper]
+
+        return checkers, pinned, pin_rays
+
+    # The legal en-passant captures for the player, as packed int moves. Taking en-passant removes two pieces
+    # from the same rank, which can expose the king in ways a pin doesn't describe, so each one is tried on the board.
+    def _legal_en_passant_moves(self, white):
+        piece = self.last_moved_piece
+        enemy_pawn = BLACK_PAWN if white else WHITE_PAWN
+        if piece != enemy_pawn or abs(self.last_moved_piece_from[0] - self.last_moved_piece_to[0]) != 2:
+            return ()
+
+        end_square = ((self.last_moved_piece_from[0] + self.last_moved_piece_to[0]) // 2, self.last_moved_piece_to[1])
+        end_index = end_square[0] * 8 + end_square[1]
+
+        # Our pawns that attack the square the enemy pawn passed over.
+        capturers = PAWN_ATTACKS[1 if white else 0][end_index] & self.bitboards.pieces[WHITE_PAWN if white else BLACK_PAWN]
+
+        moves = []
+        for index in Bitboards.indexes(capturers):
+            self._make_move(SQUARE_TO_POS[index], end_square, EMPTY)
+            legal = not self._is_player_in_check(self.board_state, white)
+            self.unmake_move()
+            if legal:
+                moves.append(Move.encode(index, end_index, EN_PASSANT))
+        return moves
 
     def promote_pawn(self, pos, new_piece_id):
         if pos[0] != 0 and pos[0] != 7:
@@ -396,25 +961,25 @@ class Board:
 
         piece = self.board_state[pos[0]][pos[1]]
 
-        if piece != Piece.WHITE_PAWN and piece != Piece.BLACK_PAWN:
+        if piece != WHITE_PAWN and piece != BLACK_PAWN:
             raise Exception("Piece is not a pawn.")
 
-        if piece == Piece.WHITE_PAWN:
-            if (new_piece_id != Piece.WHITE_KNIGHT and
-                new_piece_id != Piece.WHITE_BISHOP and
-                new_piece_id != Piece.WHITE_ROOK and
-                new_piece_id != Piece.WHITE_QUEEN):
+        if piece == WHITE_PAWN:
+            if (new_piece_id != WHITE_KNIGHT and
+                new_piece_id != WHITE_BISHOP and
+                new_piece_id != WHITE_ROOK and
+                new_piece_id != WHITE_QUEEN):
                 raise Exception("Invalid new piece id.")
 
-        if piece == Piece.BLACK_PAWN:
-            if (new_piece_id != Piece.BLACK_KNIGHT and
-                new_piece_id != Piece.BLACK_BISHOP and
-                new_piece_id != Piece.BLACK_ROOK and
-                new_piece_id != Piece.BLACK_QUEEN):
+        if piece == BLACK_PAWN:
+            if (new_piece_id != BLACK_KNIGHT and
+                new_piece_id != BLACK_BISHOP and
+                new_piece_id != BLACK_ROOK and
+                new_piece_id != BLACK_QUEEN):
                 raise Exception("Invalid new piece id.")
 
         # Allow the promotion.  
-        self.board_state[pos[0]][pos[1]] = new_piece_id
+        self.set_piece(pos[0], pos[1], new_piece_id)
 
         
 
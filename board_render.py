@@ -3,36 +3,38 @@
 # Created by Martin Blore 2023
 # Full explanation can be found at https://codewithmartin.io/articles/how-to-code-a-chess-game-in-python
 # --------------------------------------------------------------------------------------------------------
+import math
 import pygame
 from piece import Piece
-from images import Images
 
+# The pygame side of the board. Board itself holds only the rules state, so it can be used without a display;
+# where the board is drawn, its colours and the piece being dragged belong to the view (see BoardView).
 class BoardRender:
-    def draw_pieces(board, screen, images: Images):
-        for row_index, row in enumerate(board.board_state):
-            for col_index, col in enumerate(row):
-                # Dont draw hidden cells.
-                if (row_index == board.hide_row_index and col_index == board.hide_col_index):
-                    continue
-
-                # Draw pieces.
-                if (row[col_index] != Piece.NONE):
-                    xpos = board.board_start_x + (board.cell_size * col_index)
-                    ypos = board.board_start_y + (board.cell_size * row_index)
-
-                    img = images.get_image_for_piece(row[col_index])
-                    screen.blit(img, (xpos, ypos))
-
-        BoardRender._draw_drag_piece(board, screen, images)
-
-    def _draw_drag_piece(board, screen, images):
-        # Draw dragging piece.
-        if (board.dragging_piece != Piece.NONE):
+    # Gets the board square that the mouse cursor is over, or was over when mouse_pos was recorded.
+    def board_index_from_mouse_pos(view, mouse_pos = None):
+        if mouse_pos is None:
             mouse_pos = pygame.mouse.get_pos()
-            img = images.get_image_for_piece(board.dragging_piece)
-            screen.blit(img, (mouse_pos[0]-(board.cell_size/2), mouse_pos[1]-(board.cell_size/2)))
 
-    def draw_board(board, screen):
+        grid_x = mouse_pos[0] - view.board_start_x
+        grid_y = mouse_pos[1] - view.board_start_y
+
+        clicked_in_grid = True
+
+        if (grid_x < 0 or grid_y < 0):
+            clicked_in_grid = False
+
+        if (grid_x > view.cell_size * 8 or grid_y > view.cell_size * 8):
+            clicked_in_grid = False
+
+        if (clicked_in_grid):
+            col_index = math.floor(grid_x / view.cell_size)
+            row_index = math.floor(grid_y / view.cell_size)
+
+            return (row_index, col_index)
+        else:
+            return (-1, -1)
+
+    def draw_board(view, screen):
         white_square = True
 
         # Draw the board, starting with the cell column, and then draw each cell going down.
@@ -47,16 +49,188 @@ class BoardRender:
             for y in range(0, 8):
 
                 # Lets calculate the position of our rectangle depending on the X/Y of the cell we're drawing.
-                xpos = board.board_start_x + (x * board.cell_size)
-                ypos = board.board_start_y + (y * board.cell_size)
+                xpos = view.board_start_x + (x * view.cell_size)
+                ypos = view.board_start_y + (y * view.cell_size)
 
                 # Draw the square.
                 if (white_square == True):
-                    pygame.draw.rect(screen, board.white_square_color,
-                                    pygame.Rect(xpos, ypos, board.cell_size, board.cell_size))
+                    pygame.draw.rect(screen, view.white_square_color,
+                                    pygame.Rect(xpos, ypos, view.cell_size, view.cell_size))
                 else:
-                    pygame.draw.rect(screen, board.black_square_color,
-                                    pygame.Rect(xpos, ypos, board.cell_size, board.cell_size))
+                    pygame.draw.rect(screen, view.black_square_color,
+                                    pygame.Rect(xpos, ypos, view.cell_size, view.cell_size))
 
                 # Flip our white square flag, so our next square will be the opposite color.
-                white_square = not white_square
\ No newline at end of file
+                white_square = not white_square
+
+# Retained-mode renderer. The empty board, the labels and the background are drawn once into a cached surface,
+# and each frame only repaints what changed since the last one: squares whose piece changed, the status text,
+# and where the dragged piece was and now is. Only those rects are pushed to the display, so a frame where
+# nothing changed costs almost nothing.
+# The view also holds the front end's state for the board: where it is drawn, the square colours, and the piece
+# being dragged, whose square is hidden while the piece follows the mouse.
+class BoardView:
+    def __init__(self, screen, font, images, bg_color):
+        self.screen = screen
+        self.font = font
+        self.images = images
+        self.bg_color = bg_color
+
+        self.cell_size = 100
+        self.board_start_x = 100
+        self.board_start_y = 100
+        self.white_square_color = (230, 230, 230)
+        self.black_square_color = (100, 150, 100)
+        self.hide_row_index = -1
+        self.hide_col_index = -1
+        self.start_drag_square = (-1, -1)
+        self.dragging_piece = Piece.NONE
+
+        # The static parts of the frame, rebuilt by a full redraw.
+        self.background = None
+
+        # Pieces as last drawn, one per square index with the hidden square as EMPTY, and what else was drawn.
+        self.drawn_pieces = [Piece.NONE] * 64
+        self.drawn_drag_rect = None
+        self.drawn_status = None
+
+        # Rendered text, keyed by (text, colour), as font.render is slow.
+        self.text_cache = {}
+
+        self.full_redraw = True
+
+    # Causes the specific square to not be drawn, used for when drag operations are happening.
+    def hide_square(self, row, col):
+        self.hide_row_index = row
+        self.hide_col_index = col
+
+    # Unhides the hidden square.
+    def unhide_square(self):
+        self.hide_row_index = -1
+        self.hide_col_index = -1
+
+    def start_drag(self, board, row, col):
+        self.hide_square(row, col)
+        self.start_drag_square = row, col
+        self.dragging_piece = board.board_state[row][col]
+
+    def stop_drag(self):
+        self.unhide_square()
+        self.dragging_piece = Piece.NONE
+
+    # Forces the next render to redraw everything, e.g. after the window was resized or uncovered.
+    def invalidate(self, screen = None):
+        if screen is not None:
+            self.screen = screen
+        self.full_redraw = True
+
+    # Draws the board, and status lines given as (text, colour) pairs at the right of the board, one line
+    # per entry with None leaving its line empty.
+    def render(self, board, status):
+        screen = self.screen
+        cell_size = self.cell_size
+        pieces = [piece for row in board.board_state for piece in row]
+        if self.hide_row_index != -1:
+            pieces[self.hide_row_index * 8 + self.hide_col_index] = Piece.NONE
+
+        drag_rect = None
+        if self.dragging_piece != Piece.NONE:
+            mouse_pos = pygame.mouse.get_pos()
+            drag_rect = pygame.Rect(mouse_pos[0] - cell_size // 2, mouse_pos[1] - cell_size // 2, cell_size, cell_size)
+
+        status = tuple(status)
+        status_rect = self._status_rect()
+
+        if self.full_redraw or self.background is None or self.background.get_size() != screen.get_size():
+            self.background = self._build_background()
+            dirty = [screen.get_rect()]
+        else:
+            dirty = []
+            drawn_pieces = self.drawn_pieces
+            for index in range(64):
+                if pieces[index] != drawn_pieces[index]:
+                    dirty.append(self._square_rect(index))
+            if status != self.drawn_status:
+                dirty.append(status_rect)
+            if drag_rect != self.drawn_drag_rect:
+                if self.drawn_drag_rect is not None:
+                    dirty.append(self.drawn_drag_rect)
+                if drag_rect is not None:
+                    dirty.append(drag_rect)
+
+        if dirty:
+            for rect in dirty:
+                # Repaint everything that overlaps the rect, clipped to it, so partly covered pieces aren't blended twice.
+                screen.set_clip(rect)
+                screen.blit(self.background, rect, rect)
+                self._draw_pieces(pieces, rect)
+                if status_rect.colliderect(rect):
+                    self._draw_status(status, status_rect)
+                if drag_rect is not None and drag_rect.colliderect(rect):
+                    screen.blit(self.images.get_image_for_piece(self.dragging_piece), drag_rect)
+            screen.set_clip(None)
+
+            if self.full_redraw:
+                pygame.display.flip()
+            else:
+                pygame.display.update(dirty)
+
+        self.drawn_pieces = pieces
+        self.drawn_drag_rect = drag_rect
+        self.drawn_status = status
+        self.full_redraw = False
+
+    def _build_background(self):
+        background = pygame.Surface(self.screen.get_size()).convert()
+        background.fill(self.bg_color)
+        BoardRender.draw_board(self, background)
+
+        # Board labels.
+        cell_size = self.cell_size
+        for row in range(0, 8):
+            background.blit(self._text(str(8-row), (255, 255, 255)),
+                (self.board_start_x - 20, self.board_start_y + (row * cell_size) + (cell_size / 2) - 4))
+        for i, letter in enumerate("ABCDEFGH"):
+            background.blit(self._text(letter, (255, 255, 255)),
+                (self.board_start_x + (i * cell_size) + (cell_size / 2) - 4, self.board_start_y + (8 * cell_size) + 10))
+
+        return background
+
+    def _draw_pieces(self, pieces, rect):
+        cell_size = self.cell_size
+        for index in self._squares_in_rect(rect):
+            piece = pieces[index]
+            if piece != Piece.NONE:
+                self.screen.blit(self.images.get_image_for_piece(piece),
+                    (self.board_start_x + (index & 7) * cell_size, self.board_start_y + (index >> 3) * cell_size))
+
+    def _draw_status(self, status, status_rect):
+        for line, entry in enumerate(status):
+            if entry is not None:
+                self.screen.blit(self._text(entry[0], entry[1]), (status_rect.x, status_rect.y + line * 50))
+
+    # Square indexes the rect overlaps.
+    def _squares_in_rect(self, rect):
+        cell_size = self.cell_size
+        first_col = max(0, (rect.left - self.board_start_x) // cell_size)
+        last_col = min(7, (rect.right - 1 - self.board_start_x) // cell_size)
+        first_row = max(0, (rect.top - self.board_start_y) // cell_size)
+        last_row = min(7, (rect.bottom - 1 - self.board_start_y) // cell_size)
+        return [row * 8 + col for row in range(first_row, last_row + 1) for col in range(first_col, last_col + 1)]
+
+    def _square_rect(self, index):
+        cell_size = self.cell_size
+        return pygame.Rect(self.board_start_x + (index & 7) * cell_size, self.board_start_y + (index >> 3) * cell_size,
+            cell_size, cell_size)
+
+    # The area to the right of the board that the status lines are drawn in.
+    def _status_rect(self):
+        left = self.board_start_x + 8 * self.cell_size + 100
+        return pygame.Rect(left, self.board_start_y, max(0, self.screen.get_width() - left), 200)
+
+    def _text(self, text, colour):
+        surface = self.text_cache.get((text, colour))
+        if surface is None:
+            surface = self.font.render(text, True, colour)
+            self.text_cache[(text, colour)] = surface
+        return surface
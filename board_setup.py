@@ -3,40 +3,73 @@
 # Created by Martin Blore 2023
 # Full explanation can be found at https://codewithmartin.io/articles/how-to-code-a-chess-game-in-python
 # --------------------------------------------------------------------------------------------------------
-from piece import Piece
+from piece import (BLACK_BISHOP, BLACK_KING, BLACK_KNIGHT, BLACK_PAWN, BLACK_QUEEN, BLACK_ROOK,
+    WHITE_BISHOP, WHITE_KING, WHITE_KNIGHT, WHITE_PAWN, WHITE_QUEEN, WHITE_ROOK)
+
+# FEN piece letters.
+FEN_PIECES = {
+    "P": WHITE_PAWN, "N": WHITE_KNIGHT, "B": WHITE_BISHOP,
+    "R": WHITE_ROOK, "Q": WHITE_QUEEN, "K": WHITE_KING,
+    "p": BLACK_PAWN, "n": BLACK_KNIGHT, "b": BLACK_BISHOP,
+    "r": BLACK_ROOK, "q": BLACK_QUEEN, "k": BLACK_KING
+}
+
+# The standard starting position.
+STANDARD_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
 
 # Premade board setups.
 class BoardSetup:
     def setup_stale_mate(board):
-        board.board_state[0][0] = Piece.BLACK_KING
-        board.board_state[7][7] = Piece.WHITE_KING
-        board.board_state[4][4] = Piece.WHITE_QUEEN
+        board.set_piece(0, 0, BLACK_KING)
+        board.set_piece(7, 7, WHITE_KING)
+        board.set_piece(4, 4, WHITE_QUEEN)
 
     def setup_standard(board):
         # Place pawns on 2nd row.
         for i, cell in enumerate(board.board_state[1]):
-            board.board_state[1][i] = Piece.BLACK_PAWN
+            board.set_piece(1, i, BLACK_PAWN)
 
         # Place pawns on 7th row.
         for i, cell in enumerate(board.board_state[6]):
-            board.board_state[6][i] = Piece.WHITE_PAWN
+            board.set_piece(6, i, WHITE_PAWN)
 
         # Rooks
-        board.board_state[0][0] = board.board_state[0][7] = Piece.BLACK_ROOK
-        board.board_state[7][0] = board.board_state[7][7] = Piece.WHITE_ROOK
+        board.set_piece(0, 0, BLACK_ROOK)
+        board.set_piece(0, 7, BLACK_ROOK)
+        board.set_piece(7, 0, WHITE_ROOK)
+        board.set_piece(7, 7, WHITE_ROOK)
 
         # Knights
-        board.board_state[0][1] = board.board_state[0][6] = Piece.BLACK_KNIGHT
-        board.board_state[7][1] = board.board_state[7][6] = Piece.WHITE_KNIGHT
+        board.set_piece(0, 1, BLACK_KNIGHT)
+        board.set_piece(0, 6, BLACK_KNIGHT)
+        board.set_piece(7, 1, WHITE_KNIGHT)
+        board.set_piece(7, 6, WHITE_KNIGHT)
 
         # Bishops
-        board.board_state[0][2] = board.board_state[0][5] = Piece.BLACK_BISHOP
-        board.board_state[7][2] = board.board_state[7][5] = Piece.WHITE_BISHOP
+        board.set_piece(0, 2, BLACK_BISHOP)
+        board.set_piece(0, 5, BLACK_BISHOP)
+        board.set_piece(7, 2, WHITE_BISHOP)
+        board.set_piece(7, 5, WHITE_BISHOP)
 
         # Queens
-        board.board_state[0][3] = Piece.BLACK_QUEEN
-        board.board_state[7][3] = Piece.WHITE_QUEEN
+        board.set_piece(0, 3, BLACK_QUEEN)
+        board.set_piece(7, 3, WHITE_QUEEN)
 
         # Kings
-        board.board_state[0][4] = Piece.BLACK_KING
-        board.board_state[7][4] = Piece.WHITE_KING
\ No newline at end of file
+        board.set_piece(0, 4, BLACK_KING)
+        board.set_piece(7, 4, WHITE_KING)
+
+    # Sets up a position from a FEN string (piece placement, side to move, castling rights, en-passant square
+    # and move counters).
+    def setup_fen(board, fen):
+        board.load_fen(fen)
+
+    # Reads a file with one FEN per line, loading each into the same board and yielding it. Reusing one board keeps
+    # bulk loads from allocating a Board per position, so copy anything that's needed past the next line.
+    def read_fens(board, path):
+        with open(path) as file:
+            for line in file:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    board.load_fen(line)
+                    yield board
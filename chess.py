@@ -5,12 +5,21 @@
 # --------------------------------------------------------------------------------------------------------
 import sys
 import pygame
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
-from board import Board
+from board import CHECKMATE, STALEMATE, Board
+from board_render import BoardRender, BoardView
 from images import Images
-from piece import Piece
+from move_result import MoveResult
+from piece import EMPTY
 from sounds import Sounds
 
+# Room the board leaves to its right for the status text and below it for the file letters, and the
+# smallest squares it shrinks to when the window is resized.
+STATUS_WIDTH = 280
+BOTTOM_MARGIN = 124
+MIN_CELL_SIZE = 20
+
 class Chess():
     def __init__(self):
         self.window_size = 1280, 1024
@@ -18,123 +27,128 @@ class Chess():
         self.board = Board()
         self.images = Images()
         self.sounds = Sounds()
-        self.mouse_down = False
-        self.whites_turn = True
         self.font = None
-        self.check = False
-        self.check_mate = False
-        self.stale_mate = False
+        self.view = None
 
     def init(self):
         pygame.display.init()
         pygame.mixer.init()
         pygame.font.init()
-        self.screen = pygame.display.set_mode(
-            self.window_size, pygame.RESIZABLE)
-        pygame.display.set_caption("Chess")
-
-        self.sounds.init()
-        self.images.init((self.board.cell_size, self.board.cell_size))
-        self.board.setup()
-
-        self.font = pygame.font.SysFont(None, 24)
-
-    def update(self):
-        # Detect mouse clicks and released.
-        if pygame.mouse.get_pressed()[0] == 1:
-            if (self.mouse_down is False):
-                self.on_mouse_down()
-            self.mouse_down = True
-        else:
-            if (self.mouse_down is True):
-                self.on_mouse_up()
-            self.mouse_down = False
-
-    def on_mouse_down(self):
-        mouse_start_click = self.board.board_index_from_mouse_pos()
+
+        # Decode the images and sounds on worker threads while the window and fonts are set up.
+        with ThreadPoolExecutor(2) as loader:
+            images_loaded = loader.submit(self.images.load)
+            sounds_loaded = loader.submit(self.sounds.load)
+
+            self.screen = pygame.display.set_mode(
+                self.window_size, pygame.RESIZABLE)
+            pygame.display.set_caption("Chess")
+            self.board.setup()
+            self.font = pygame.font.SysFont(None, 24)
+
+            # The view only needs the images once it renders the pieces.
+            self.view = BoardView(self.screen, self.font, self.images, self.bg_color)
+            self.render_loading()
+
+            images_loaded.result()
+            sounds_loaded.result()
+
+        self.images.init((self.view.cell_size, self.view.cell_size))
+
+    # Placeholder frame shown while the assets load: the empty board and a loading message.
+    def render_loading(self):
+        self.screen.fill(self.bg_color)
+        BoardRender.draw_board(self.view, self.screen)
+        text = self.font.render("Loading...", True, (255, 255, 255))
+        self.screen.blit(text, (self.view.board_start_x + 8 * self.view.cell_size + 100, self.view.board_start_y))
+        pygame.display.flip()
+
+    def on_mouse_down(self, mouse_pos):
+        mouse_start_click = BoardRender.board_index_from_mouse_pos(self.view, mouse_pos)
 
         if (mouse_start_click[0] != -1):
             # If we clicked on the board with a piece, lets start the drag.
             if (self.board.is_piece_on_square(mouse_start_click[0], mouse_start_click[1])):
-                self.board.start_drag(
+                self.view.start_drag(self.board,
                     mouse_start_click[0], mouse_start_click[1])
 
-    def on_mouse_up(self):
-        mouse_end_square = self.board.board_index_from_mouse_pos()
+    def on_mouse_up(self, mouse_pos):
+        mouse_end_square = BoardRender.board_index_from_mouse_pos(self.view, mouse_pos)
 
-        if (Piece.is_white_piece(self.board.dragging_piece) and self.whites_turn):
-            result = self.board.perform_move(mouse_end_square)
-        elif (Piece.is_black_piece(self.board.dragging_piece) and not self.whites_turn):
-            result = self.board.perform_move(mouse_end_square)
-        else:
-            self.board.stop_drag()
-            return
-                
-        self.board.stop_drag()
+        # The board rejects moves by the wrong side, and promotes to a queen.
+        result = MoveResult()
+        if self.view.dragging_piece != EMPTY:
+            result = self.board.perform_move(self.view.start_drag_square, mouse_end_square)
+        self.view.stop_drag()
 
         if result.move_performed:
             if result.opponent_check_mate:
-                self.check_mate = True
                 self.sounds.play_check_mate()
             elif result.opponent_now_in_check:
-                self.check = True
                 self.sounds.play_check()
-            elif result.opponent_stale_mate:
-                self.stale_mate = True
-            elif result.promote_available:
-                self.board.promote_pawn(result.promote_position, Piece.WHITE_QUEEN if self.whites_turn else Piece.BLACK_QUEEN)
-            else:
+            elif not result.opponent_stale_mate and not result.promote_available:
                 self.sounds.play_move()
-                self.check = False
-
-            self.whites_turn = not self.whites_turn
 
     def render(self):
-        self.screen.fill(self.bg_color)
-        self.board.draw(self.screen, self.images)
-        text = self.font.render(
-            "Whites Turn" if self.whites_turn else "Blacks Turn", True, (255, 255, 255))
-        self.screen.blit(text, (1000, 100))
-
-        if self.check:
-            text = self.font.render(
-                "Check - White" if self.whites_turn else "Check - Black", True, (255, 255, 0))
-            self.screen.blit(text, (1000, 150))
-
-        if self.check_mate:
-            text = self.font.render(
-                "Check Mate - White" if self.whites_turn else "Check Mate - Black", True, (255, 0, 0))
-            self.screen.blit(text, (1000, 200))
-
-        if self.stale_mate:
-            text = self.font.render(
-                "Stale Mate - White" if self.whites_turn else "Stale Mate - Black", True, (255, 0, 255))
-            self.screen.blit(text, (1000, 250))
-
-        # Draw board labels.
-        for row in range(0, 8):
-            text = self.font.render(str(8-row), True, (255, 255, 255))
-            self.screen.blit(
-                text, (80, 100+(row*self.board.cell_size)+(self.board.cell_size/2)-4))
-        letters = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H']
-        for i, x in enumerate(letters):
-            text = self.font.render(str(x), True, (255, 255, 255))
-            self.screen.blit(
-                text, (100+(i*self.board.cell_size)+(self.board.cell_size/2)-4, 910))
+        whites_turn = self.board.whites_turn
+        status = [("Whites Turn" if whites_turn else "Blacks Turn", (255, 255, 255)), None, None, None]
 
-        pygame.display.flip()
+        if self.board.in_check:
+            status[1] = ("Check - White" if whites_turn else "Check - Black", (255, 255, 0))
+
+        if self.board.result_reason == CHECKMATE:
+            status[2] = ("Check Mate - White" if whites_turn else "Check Mate - Black", (255, 0, 0))
+
+        if self.board.result_reason == STALEMATE:
+            status[3] = ("Stale Mate - White" if whites_turn else "Stale Mate - Black", (255, 0, 255))
 
+        self.view.render(self.board, status)
+
+    # Sizes the squares so the board fits the window. Images.scale keeps recent sizes, so resizing back and
+    # forth doesn't rescale the pieces every time.
+    def fit_board_to_window(self, window_size):
+        cell_size = min((window_size[0] - self.view.board_start_x - STATUS_WIDTH) // 8,
+            (window_size[1] - self.view.board_start_y - BOTTOM_MARGIN) // 8)
+        self.view.cell_size = max(MIN_CELL_SIZE, cell_size)
+        self.images.scale((self.view.cell_size, self.view.cell_size))
+
+    # Sleeps until an event arrives instead of polling, and only renders when something could have changed,
+    # so an idle board uses no CPU.
     def run(self):
-        clock = pygame.time.Clock()
+        # Don't wake up for events we ignore.
+        pygame.event.set_blocked(None)
+        pygame.event.set_allowed([pygame.QUIT, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP, pygame.MOUSEMOTION,
+            pygame.VIDEORESIZE, pygame.WINDOWEXPOSED])
+
+        self.render()
         while 1:
-            for event in pygame.event.get():
+            # Take everything else that's queued too, so a burst of mouse motion only renders once.
+            events = [pygame.event.wait()] + pygame.event.get()
+
+            changed = False
+            for event in events:
                 if event.type == pygame.QUIT:
                     pygame.quit()
                     sys.exit()
-
-            clock.tick(120)
-            self.update()
-            self.render()
+                elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                    self.on_mouse_down(event.pos)
+                    changed = True
+                elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+                    self.on_mouse_up(event.pos)
+                    changed = True
+                elif event.type == pygame.MOUSEMOTION:
+                    # Only a dragged piece follows the mouse.
+                    if self.view.dragging_piece != EMPTY:
+                        changed = True
+                elif event.type == pygame.VIDEORESIZE or event.type == pygame.WINDOWEXPOSED:
+                    # The window contents are gone or the wrong size, so everything has to be drawn again.
+                    if event.type == pygame.VIDEORESIZE:
+                        self.fit_board_to_window(event.size)
+                    self.view.invalidate(pygame.display.get_surface())
+                    changed = True
+
+            if changed:
+                self.render()
 
 app = Chess()
 app.init()
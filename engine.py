@@ -0,0 +1,349 @@
+# --------------------------------------------------------------------------------------------------------
+# Chess with PyGame
+# Created by Martin Blore 2023
+# Full explanation can be found at https://codewithmartin.io/articles/how-to-code-a-chess-game-in-python
+# --------------------------------------------------------------------------------------------------------
+import time
+from evaluation import PIECE_VALUES, TYPE_VALUES, evaluate
+from move import MAX_PLY, PROMOTION, PROMOTION_TYPES, TACTICAL_BITS, Move, MoveBuffers
+from piece import EMPTY
+from transposition_table import EXACT, LOWER_BOUND, UPPER_BOUND, TranspositionTable
+
+INFINITY = 1000000
+MATE_SCORE = 100000
+
+# Scores beyond this are mates, stored in the table relative to the node rather than the root.
+MATE_THRESHOLD = MATE_SCORE - 1000
+
+MAX_DEPTH = 64
+
+# How often (in nodes) the clock is read, reading it on every node costs more than the check itself.
+TIME_CHECK_INTERVAL = 1024
+
+# The results of a search.
+class SearchResult:
+    def __init__(self):
+        # The best move found as a (start_square, end_square, promotion) tuple, None if there are no legal moves.
+        self.best_move = None
+
+        # Score in centipawns from the point of view of the side to move.
+        self.score = 0
+
+        # The deepest iteration that was searched to completion.
+        self.depth = 0
+
+        # Nodes searched and time taken across all iterations.
+        self.nodes = 0
+        self.seconds = 0.0
+
+        # Expected line of play from the root, read back out of the transposition table.
+        self.pv = []
+
+# Raised inside the search to unwind it when a limit is hit. Every make_move is paired with
+# an unmake_move in a finally block, so the board is back at the root position when it lands.
+class SearchAborted(Exception):
+    pass
+
+# Iterative deepening alpha-beta search over a Board, with a transposition table so each new
+# iteration (and each new search of a related position) reuses the work of the ones before it.
+class Engine:
+    def __init__(self, board, hash_size_mb = 16):
+        self.board = board
+        self.table = TranspositionTable(hash_size_mb)
+        self.nodes = 0
+        self.node_limit = 0
+        self.deadline = 0.0
+
+        # Set from another thread to make a running search return as soon as possible.
+        self.stop_requested = False
+
+        # Move lists and ordering scores for every ply, filled in place by the search. Moves inside the
+        # search and in the table are packed ints (see move.py), only SearchResult uses tuples.
+        self.buffers = MoveBuffers()
+
+    def set_hash_size(self, size_mb):
+        self.table.resize(size_mb)
+
+    def stop(self):
+        self.stop_requested = True
+
+    # The static score of the current position with its captures played out, from the point of view of the
+    # side to move. For callers that search the ply above it themselves, e.g. a depth 1 parallel search.
+    def quiescence_score(self):
+        self.nodes = 0
+        self.node_limit = 0
+        self.deadline = 0.0
+        self.stop_requested = False
+        return self._quiesce(0, -INFINITY, INFINITY)
+
+    # Searches the current board position. Any combination of limits can be given, and the search ends when
+    # the first one is hit: max_depth in plies, time_limit in seconds, node_limit in nodes. With no limits
+    # at all the search runs until stop() is called or MAX_DEPTH is reached.
+    # on_iteration is called with the SearchResult after every completed depth.
+    def search(self, max_depth = MAX_DEPTH, time_limit = None, node_limit = None, on_iteration = None):
+        start_time = time.perf_counter()
+        self.nodes = 0
+        self.node_limit = node_limit or 0
+        self.deadline = start_time + time_limit if time_limit else 0.0
+        self.stop_requested = False
+        self.table.new_search()
+
+        result = SearchResult()
+        white = self.board.whites_turn
+        buffer = self.buffers.moves[0]
+        root_moves = buffer[:self.board.generate_moves(buffer)]
+        if root_moves:
+            # Always have a move to return, even if the first iteration is cut short.
+            result.best_move = Move.to_tuple(root_moves[0], white)
+
+        for depth in range(1, min(max_depth, MAX_DEPTH) + 1):
+            if not root_moves:
+                break
+
+            try:
+                score, best_move = self._search_root(root_moves, depth)
+            except SearchAborted:
+                break
+
+            result.best_move = Move.to_tuple(best_move, white)
+            result.score = score
+            result.depth = depth
+            result.nodes = self.nodes
+            result.seconds = time.perf_counter() - start_time
+            result.pv = self._principal_variation(depth)
+
+            if on_iteration is not None:
+                on_iteration(result)
+
+            # A forced mate has been found, deeper searches can't improve on it.
+            if abs(score) >= MATE_THRESHOLD:
+                break
+
+            # The next iteration usually takes several times longer than this one, so don't start it
+            # if more than half the time is gone.
+            if self.deadline and time.perf_counter() - start_time > (self.deadline - start_time) / 2:
+                break
+
+        result.nodes = self.nodes
+        result.seconds = time.perf_counter() - start_time
+        return result
+
+    # The root moves are a list of their own, kept in the order the last iteration sorted them into.
+    def _search_root(self, root_moves, depth):
+        board = self.board
+        entry = self.table.probe(board.zobrist_key)
+        scores = self.buffers.scores[0]
+        self._score_moves(root_moves, scores, len(root_moves), entry[4] if entry is not None else None)
+        order = sorted(range(len(root_moves)), key=scores.__getitem__, reverse=True)
+        root_moves[:] = [root_moves[i] for i in order]
+
+        alpha = -INFINITY
+        beta = INFINITY
+        best_move = root_moves[0]
+
+        for move in root_moves:
+            board.make_move_code(move)
+            try:
+                score = -self._negamax(depth - 1, 1, -beta, -alpha)
+            finally:
+                board.unmake_move()
+
+            if score > alpha:
+                alpha = score
+                best_move = move
+
+        self.table.store(board.zobrist_key, depth, alpha, EXACT, best_move)
+        return alpha, best_move
+
+    def _negamax(self, depth, ply, alpha, beta):
+        self._count_node()
+
+        board = self.board
+        key = board.zobrist_key
+        original_alpha = alpha
+
+        table_move = None
+        entry = self.table.probe(key)
+        if entry is not None:
+            table_move = entry[4]
+            if entry[1] >= depth:
+                score = self._score_from_table(entry[2], ply)
+                bound = entry[3]
+                if bound == EXACT:
+                    return score
+                if bound == LOWER_BOUND and score >= beta:
+                    return score
+                if bound == UPPER_BOUND and score <= alpha:
+                    return score
+
+        if depth <= 0 or ply >= MAX_PLY - 1:
+            return self._quiesce(ply, alpha, beta)
+
+        moves = self.buffers.moves[ply]
+        count = board.generate_moves(moves)
+        if count == 0:
+            if board._is_player_in_check(board.board_state, board.whites_turn):
+                # Prefer the quickest mate, and the slowest when being mated.
+                return -MATE_SCORE + ply
+            return 0
+
+        scores = self.buffers.scores[ply]
+        self._score_moves(moves, scores, count, table_move)
+
+        best_score = -INFINITY
+        best_move = None
+        ordering = True
+        for i in range(count):
+            if ordering:
+                ordering = self._pick_move(moves, scores, i, count) > 0
+            move = moves[i]
+            board.make_move_code(move)
+            try:
+                score = -self._negamax(depth - 1, ply + 1, -beta, -alpha)
+            finally:
+                board.unmake_move()
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+
+        if best_score <= original_alpha:
+            bound = UPPER_BOUND
+        elif best_score >= beta:
+            bound = LOWER_BOUND
+        else:
+            bound = EXACT
+        self.table.store(key, depth, self._score_to_table(best_score, ply), bound, best_move)
+
+        return best_score
+
+    # Only captures and promotions are searched past the horizon, so a score is never taken
+    # in the middle of an exchange. In check there is no standing pat, since the side to move may have
+    # nothing that stops the threat: every evasion is searched, and having none is mate.
+    def _quiesce(self, ply, alpha, beta):
+        board = self.board
+        if ply >= MAX_PLY - 1:
+            return self.evaluate()
+
+        in_check = board._is_player_in_check(board.board_state, board.whites_turn)
+        if not in_check:
+            stand_pat = self.evaluate()
+            if stand_pat >= beta:
+                return stand_pat
+            if stand_pat > alpha:
+                alpha = stand_pat
+
+        moves = self.buffers.moves[ply]
+        count = board.generate_moves(moves)
+        if count == 0:
+            return -MATE_SCORE + ply if in_check else 0
+
+        # Out of check, drop the quiet moves by moving the tactical ones to the front of the buffer.
+        if not in_check:
+            tactical = 0
+            for i in range(count):
+                move = moves[i]
+                if move & TACTICAL_BITS:
+                    moves[tactical] = move
+                    tactical += 1
+            count = tactical
+
+        scores = self.buffers.scores[ply]
+        self._score_moves(moves, scores, count, None)
+
+        for i in range(count):
+            self._pick_move(moves, scores, i, count)
+            move = moves[i]
+            self._count_node()
+            board.make_move_code(move)
+            try:
+                score = -self._quiesce(ply + 1, -beta, -alpha)
+            finally:
+                board.unmake_move()
+
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+
+        return alpha
+
+    # Static score from the point of view of the side to move, see evaluation.py.
+    def evaluate(self):
+        return evaluate(self.board)
+
+    # Fills scores with the ordering score of each of the first count moves: the table move first, then
+    # captures of the most valuable piece by the least valuable attacker, then promotions, and 0 for quiet moves.
+    def _score_moves(self, moves, scores, count, table_move):
+        state = self.board.board_state
+        for i in range(count):
+            move = moves[i]
+            if move == table_move:
+                scores[i] = 1000000
+                continue
+            score = 0
+            end_index = move >> 6 & 63
+            victim = state[end_index >> 3][end_index & 7]
+            if victim != EMPTY:
+                start_index = move & 63
+                score += 10 * PIECE_VALUES[victim] - PIECE_VALUES[state[start_index >> 3][start_index & 7]] + 10000
+            if move >> 12 & PROMOTION:
+                score += TYPE_VALUES[PROMOTION_TYPES[move >> 12 & 3]] + 10000
+            scores[i] = score
+
+    # Swaps the best scoring move from position i onwards into position i. Picking one move at a time rather
+    # than sorting means a node that cuts off early never orders the rest of its moves, and once the best left
+    # scores 0 the rest are all quiet moves and need no ordering at all, which the caller can skip.
+    def _pick_move(self, moves, scores, i, count):
+        best = max(range(i, count), key=scores.__getitem__)
+        if best != i:
+            moves[i], moves[best] = moves[best], moves[i]
+            scores[i], scores[best] = scores[best], scores[i]
+        return scores[i]
+
+    def _count_node(self):
+        self.nodes += 1
+        if self.stop_requested or (self.node_limit and self.nodes >= self.node_limit):
+            raise SearchAborted()
+        if self.deadline and self.nodes % TIME_CHECK_INTERVAL == 0 and time.perf_counter() >= self.deadline:
+            raise SearchAborted()
+
+    # Mate scores are stored relative to the node so they stay correct when reached at a different ply.
+    def _score_to_table(self, score, ply):
+        if score >= MATE_THRESHOLD:
+            return score + ply
+        if score <= -MATE_THRESHOLD:
+            return score - ply
+        return score
+
+    def _score_from_table(self, score, ply):
+        if score >= MATE_THRESHOLD:
+            return score - ply
+        if score <= -MATE_THRESHOLD:
+            return score + ply
+        return score
+
+    # Follows the stored best moves from the root, checking each is still legal.
+    def _principal_variation(self, depth):
+        board = self.board
+        # The search stops short of the last ply, so its buffer is free here.
+        moves = self.buffers.moves[MAX_PLY - 1]
+        pv = []
+        seen = set()
+
+        while len(pv) < depth and board.zobrist_key not in seen:
+            seen.add(board.zobrist_key)
+            entry = self.table.probe(board.zobrist_key)
+            if entry is None or entry[4] is None or entry[4] not in moves[:board.generate_moves(moves)]:
+                break
+            pv.append(Move.to_tuple(entry[4], board.whites_turn))
+            board.make_move_code(entry[4])
+
+        for _ in pv:
+            board.unmake_move()
+
+        return pv
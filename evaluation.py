@@ -0,0 +1,261 @@
+# --------------------------------------------------------------------------------------------------------
+# Chess with PyGame
+# Created by Martin Blore 2023
+# Full explanation can be found at https://codewithmartin.io/articles/how-to-code-a-chess-game-in-python
+# --------------------------------------------------------------------------------------------------------
+
+# Static evaluation of a position: material, piece-square tables, mobility, king safety and pawn structure.
+#
+# Material and the piece-square tables are the bulk of the score and only change where pieces move, so
+# Board.set_piece keeps running totals of them (middlegame_score, endgame_score and phase) and nothing here
+# scans the board for them. The other terms are worked out from the bitboards when evaluate() is called,
+# and the pawn structure is cached by the pawn positions, which rarely change between evaluations.
+#
+# Scores are in centipawns. The running totals are from white's point of view, evaluate() returns the score
+# for the side to move.
+from attack_tables import KING_ATTACKS, KNIGHT_ATTACKS, bishop_attacks, queen_attacks, rook_attacks
+from bitboard import Bitboards
+from piece import (BISHOP, BLACK, BLACK_KING, BLACK_PAWN, KING, KNIGHT, PAWN, PIECE_CODES, QUEEN, ROOK, TYPE_MASK,
+    WHITE_KING, WHITE_PAWN)
+
+# Material values, indexed by piece type.
+TYPE_VALUES = [0, 100, 320, 330, 500, 900, 0]
+
+# The same values indexed by piece code, so either colour can be looked up directly.
+PIECE_VALUES = [TYPE_VALUES[code & TYPE_MASK] if code & TYPE_MASK <= KING else 0 for code in range(PIECE_CODES)]
+
+'''
+Piece-square tables, from white's point of view and laid out like the board (the 8th rank first), so
+they are indexed by square index directly. Black uses the same tables mirrored top to bottom (index ^ 56).
+'''
+
+PAWN_TABLE = [
+      0,   0,   0,   0,   0,   0,   0,   0,
+     50,  50,  50,  50,  50,  50,  50,  50,
+     10,  10,  20,  30,  30,  20,  10,  10,
+      5,   5,  10,  25,  25,  10,   5,   5,
+      0,   0,   0,  20,  20,   0,   0,   0,
+      5,  -5, -10,   0,   0, -10,  -5,   5,
+      5,  10,  10, -20, -20,  10,  10,   5,
+      0,   0,   0,   0,   0,   0,   0,   0]
+
+# In the endgame a pawn is worth more the closer it is to promoting, wherever it stands on the rank.
+PAWN_ENDGAME_TABLE = [
+      0,   0,   0,   0,   0,   0,   0,   0,
+     80,  80,  80,  80,  80,  80,  80,  80,
+     50,  50,  50,  50,  50,  50,  50,  50,
+     30,  30,  30,  30,  30,  30,  30,  30,
+     15,  15,  15,  15,  15,  15,  15,  15,
+      5,   5,   5,   5,   5,   5,   5,   5,
+      0,   0,   0,   0,   0,   0,   0,   0,
+      0,   0,   0,   0,   0,   0,   0,   0]
+
+KNIGHT_TABLE = [
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20,   0,   0,   0,   0, -20, -40,
+    -30,   0,  10,  15,  15,  10,   0, -30,
+    -30,   5,  15,  20,  20,  15,   5, -30,
+    -30,   0,  15,  20,  20,  15,   0, -30,
+    -30,   5,  10,  15,  15,  10,   5, -30,
+    -40, -20,   0,   5,   5,   0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50]
+
+BISHOP_TABLE = [
+    -20, -10, -10, -10, -10, -10, -10, -20,
+    -10,   0,   0,   0,   0,   0,   0, -10,
+    -10,   0,   5,  10,  10,   5,   0, -10,
+    -10,   5,   5,  10,  10,   5,   5, -10,
+    -10,   0,  10,  10,  10,  10,   0, -10,
+    -10,  10,  10,  10,  10,  10,  10, -10,
+    -10,   5,   0,   0,   0,   0,   5, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20]
+
+ROOK_TABLE = [
+      0,   0,   0,   0,   0,   0,   0,   0,
+      5,  10,  10,  10,  10,  10,  10,   5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+      0,   0,   0,   5,   5,   0,   0,   0]
+
+QUEEN_TABLE = [
+    -20, -10, -10,  -5,  -5, -10, -10, -20,
+    -10,   0,   0,   0,   0,   0,   0, -10,
+    -10,   0,   5,   5,   5,   5,   0, -10,
+     -5,   0,   5,   5,   5,   5,   0,  -5,
+      0,   0,   5,   5,   5,   5,   0,  -5,
+    -10,   5,   5,   5,   5,   5,   0, -10,
+    -10,   0,   5,   0,   0,   0,   0, -10,
+    -20, -10, -10,  -5,  -5, -10, -10, -20]
+
+# The king hides behind its pawns while there are pieces to attack it...
+KING_TABLE = [
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+     20,  20,   0,   0,   0,   0,  20,  20,
+     20,  30,  10,   0,   0,  10,  30,  20]
+
+# ...and heads for the centre once they are gone.
+KING_ENDGAME_TABLE = [
+    -50, -40, -30, -20, -20, -30, -40, -50,
+    -30, -20, -10,   0,   0, -10, -20, -30,
+    -30, -10,  20,  30,  30,  20, -10, -30,
+    -30, -10,  30,  40,  40,  30, -10, -30,
+    -30, -10,  30,  40,  40,  30, -10, -30,
+    -30, -10,  20,  30,  30,  20, -10, -30,
+    -30, -30,   0,   0,   0,   0, -30, -30,
+    -50, -30, -30, -30, -30, -30, -30, -50]
+
+MIDDLEGAME_TABLES = [None, PAWN_TABLE, KNIGHT_TABLE, BISHOP_TABLE, ROOK_TABLE, QUEEN_TABLE, KING_TABLE]
+ENDGAME_TABLES = [None, PAWN_ENDGAME_TABLE, KNIGHT_TABLE, BISHOP_TABLE, ROOK_TABLE, QUEEN_TABLE, KING_ENDGAME_TABLE]
+
+# How much each piece type counts towards the middlegame. With all the pieces on the board the phase is
+# MAX_PHASE and the middlegame score is used, with none left it's 0 and the endgame score is used.
+PHASE_WEIGHTS = [0, 0, 1, 1, 2, 4, 0]
+MAX_PHASE = 24
+
+def _piece_square_values(tables):
+    values = [[0] * 64 for _ in range(PIECE_CODES)]
+    for piece_type in range(PAWN, KING + 1):
+        for index in range(64):
+            values[piece_type][index] = TYPE_VALUES[piece_type] + tables[piece_type][index]
+            values[BLACK | piece_type][index] = -(TYPE_VALUES[piece_type] + tables[piece_type][index ^ 56])
+    return values
+
+# Material plus table value for each piece code on each square, negative for black, so the running totals
+# only ever add and subtract entries.
+MIDDLEGAME_VALUES = _piece_square_values(MIDDLEGAME_TABLES)
+ENDGAME_VALUES = _piece_square_values(ENDGAME_TABLES)
+PIECE_PHASES = [PHASE_WEIGHTS[code & TYPE_MASK] if code & TYPE_MASK <= KING else 0 for code in range(PIECE_CODES)]
+
+# Bonus per square a piece attacks that isn't taken by its own side, by piece type.
+MOBILITY_WEIGHTS = [0, 0, 4, 5, 2, 1, 0]
+
+# King safety, scaled by the phase so it fades out as the pieces come off.
+PAWN_SHIELD_BONUS = 10
+KING_ZONE_ATTACK_PENALTY = 8
+
+DOUBLED_PAWN_PENALTY = 15
+ISOLATED_PAWN_PENALTY = 12
+
+# Bonus for a passed pawn by how many ranks it has advanced.
+PASSED_PAWN_BONUS = [0, 5, 10, 20, 35, 60, 100, 0]
+
+_FILE_MASKS = [0x0101010101010101 << col for col in range(8)]
+_ADJACENT_FILE_MASKS = [(_FILE_MASKS[col - 1] if col > 0 else 0) | (_FILE_MASKS[col + 1] if col < 7 else 0) for col in range(8)]
+
+def _rows_mask(rows):
+    mask = 0
+    for row in rows:
+        if 0 <= row <= 7:
+            mask |= 0xFF << (row * 8)
+    return mask
+
+# Squares in front of a pawn on its own and the adjacent files, indexed by colour (0 white, 1 black) and square.
+# With no enemy pawn on them the pawn is passed.
+_PASSED_MASKS = [[(_FILE_MASKS[index & 7] | _ADJACENT_FILE_MASKS[index & 7]) &
+    _rows_mask(range(index >> 3) if colour == 0 else range((index >> 3) + 1, 8)) for index in range(64)] for colour in range(2)]
+
+# The squares one and two ranks in front of a king, on its own and the adjacent files, by colour and square.
+_SHIELD_MASKS = [[(_FILE_MASKS[index & 7] | _ADJACENT_FILE_MASKS[index & 7]) &
+    _rows_mask((index >> 3) - 1 - step if colour == 0 else (index >> 3) + 1 + step for step in range(2))
+    for index in range(64)] for colour in range(2)]
+
+# Pawn structure scores keyed by (white pawns, black pawns), emptied when it reaches PAWN_CACHE_SIZE entries.
+PAWN_CACHE_SIZE = 65536
+_pawn_cache = {}
+
+# Full evaluation of the board from the point of view of the side to move.
+def evaluate(board):
+    bitboards = board.bitboards
+    pieces = bitboards.pieces
+    occupied = bitboards.occupied
+    white_pieces = bitboards.white
+    black_pieces = bitboards.black
+
+    white_king = pieces[WHITE_KING]
+    black_king = pieces[BLACK_KING]
+    white_zone = KING_ATTACKS[white_king.bit_length() - 1] | white_king if white_king else 0
+    black_zone = KING_ATTACKS[black_king.bit_length() - 1] | black_king if black_king else 0
+
+    white_mobility, black_zone_attacks = _mobility(pieces, 0, occupied, white_pieces, black_zone)
+    black_mobility, white_zone_attacks = _mobility(pieces, BLACK, occupied, black_pieces, white_zone)
+
+    king_safety = KING_ZONE_ATTACK_PENALTY * (black_zone_attacks - white_zone_attacks)
+    if white_king:
+        king_safety += PAWN_SHIELD_BONUS * (_SHIELD_MASKS[0][white_king.bit_length() - 1] & pieces[WHITE_PAWN]).bit_count()
+    if black_king:
+        king_safety -= PAWN_SHIELD_BONUS * (_SHIELD_MASKS[1][black_king.bit_length() - 1] & pieces[BLACK_PAWN]).bit_count()
+
+    score = white_mobility - black_mobility + pawn_structure(pieces[WHITE_PAWN], pieces[BLACK_PAWN])
+    if not board.whites_turn:
+        score = -score
+    return score + _blend(board.middlegame_score + king_safety, board.endgame_score, board.phase, board.whites_turn)
+
+# Material and piece-square score alone, read straight from the running totals, from the point of view of
+# the side to move.
+def evaluate_material(board):
+    return _blend(board.middlegame_score, board.endgame_score, board.phase, board.whites_turn)
+
+# Mixes white's middlegame and endgame scores by the phase, for the side to move. The sign is applied before
+# rounding so both sides round the same way.
+def _blend(middlegame, endgame, phase, white):
+    phase = min(phase, MAX_PHASE)
+    score = middlegame * phase + endgame * (MAX_PHASE - phase)
+    return (score if white else -score) // MAX_PHASE
+
+# Returns the mobility score for one side's knights, bishops, rooks and queens, and how many times they
+# attack the squares around the enemy king.
+def _mobility(pieces, colour, occupied, own_pieces, enemy_king_zone):
+    not_own = ~own_pieces
+    mobility = 0
+    zone_attacks = 0
+
+    for index in Bitboards.indexes(pieces[colour | KNIGHT]):
+        attacks = KNIGHT_ATTACKS[index]
+        mobility += MOBILITY_WEIGHTS[KNIGHT] * (attacks & not_own).bit_count()
+        zone_attacks += (attacks & enemy_king_zone).bit_count()
+
+    for piece_type, attacks_for in ((BISHOP, bishop_attacks), (ROOK, rook_attacks), (QUEEN, queen_attacks)):
+        for index in Bitboards.indexes(pieces[colour | piece_type]):
+            attacks = attacks_for(index, occupied)
+            mobility += MOBILITY_WEIGHTS[piece_type] * (attacks & not_own).bit_count()
+            zone_attacks += (attacks & enemy_king_zone).bit_count()
+
+    return mobility, zone_attacks
+
+# Doubled, isolated and passed pawns for both sides, from white's point of view.
+def pawn_structure(white_pawns, black_pawns):
+    key = (white_pawns, black_pawns)
+    score = _pawn_cache.get(key)
+    if score is not None:
+        return score
+
+    score = _pawn_side_score(white_pawns, black_pawns, 0) - _pawn_side_score(black_pawns, white_pawns, 1)
+
+    if len(_pawn_cache) >= PAWN_CACHE_SIZE:
+        _pawn_cache.clear()
+    _pawn_cache[key] = score
+    return score
+
+def _pawn_side_score(pawns, enemy_pawns, colour):
+    score = 0
+    for col in range(8):
+        on_file = (pawns & _FILE_MASKS[col]).bit_count()
+        if on_file:
+            if on_file > 1:
+                score -= DOUBLED_PAWN_PENALTY * (on_file - 1)
+            if not pawns & _ADJACENT_FILE_MASKS[col]:
+                score -= ISOLATED_PAWN_PENALTY * on_file
+
+    passed_masks = _PASSED_MASKS[colour]
+    for index in Bitboards.indexes(pawns):
+        if not passed_masks[index] & enemy_pawns:
+            score += PASSED_PAWN_BONUS[7 - (index >> 3) if colour == 0 else index >> 3]
+    return score
@@ -4,84 +4,83 @@
 # Full explanation can be found at https://codewithmartin.io/articles/how-to-code-a-chess-game-in-python
 # --------------------------------------------------------------------------------------------------------
 import pygame
-import os
-from piece import Piece
+from collections import OrderedDict
+from assets import AssetBundle, asset_path
+from piece import (BLACK_BISHOP, BLACK_KING, BLACK_KNIGHT, BLACK_PAWN, BLACK_QUEEN, BLACK_ROOK, PIECE_CODES,
+    WHITE_BISHOP, WHITE_KING, WHITE_KNIGHT, WHITE_PAWN, WHITE_QUEEN, WHITE_ROOK)
 
-class Images():
-    def init(self, size):
-        location = os.path.realpath(
-            os.path.join(os.getcwd(), os.path.dirname(__file__)))
+# The piece images in the order they are laid out left to right in the atlas.
+PIECE_IMAGES = (
+    (WHITE_PAWN, "wp.png"), (BLACK_PAWN, "bp.png"),
+    (WHITE_ROOK, "wr.png"), (BLACK_ROOK, "br.png"),
+    (WHITE_KNIGHT, "wn.png"), (BLACK_KNIGHT, "bn.png"),
+    (WHITE_BISHOP, "wb.png"), (BLACK_BISHOP, "bb.png"),
+    (WHITE_QUEEN, "wq.png"), (BLACK_QUEEN, "bq.png"),
+    (WHITE_KING, "wk.png"), (BLACK_KING, "bk.png"))
 
-        # Load images keeping them at their base resolution.
-        
-        self.base_pawn_white = pygame.image.load(os.path.join(location, "images\\wp.png")).convert_alpha()
-        self.base_pawn_black = pygame.image.load(os.path.join(location, "images\\bp.png")).convert_alpha()
-        
-        self.base_rook_white = pygame.image.load(os.path.join(location, "images\\wr.png")).convert_alpha()
-        self.base_rook_black = pygame.image.load(os.path.join(location, "images\\br.png")).convert_alpha()
-        
-        self.base_knight_white = pygame.image.load(os.path.join(location, "images\\wn.png")).convert_alpha()
-        self.base_knight_black = pygame.image.load(os.path.join(location, "images\\bn.png")).convert_alpha()
+# How many scaled atlases are kept, so resizing back to a recent size doesn't scale the images again.
+SCALED_CACHE_SIZE = 8
 
-        self.base_bishop_white = pygame.image.load(os.path.join(location, "images\\wb.png")).convert_alpha()
-        self.base_bishop_black = pygame.image.load(os.path.join(location, "images\\bb.png")).convert_alpha()
+class Images():
+    def __init__(self):
+        self.base_atlas = None
 
-        self.base_queen_white = pygame.image.load(os.path.join(location, "images\\wq.png")).convert_alpha()
-        self.base_queen_black = pygame.image.load(os.path.join(location, "images\\bq.png")).convert_alpha()
+    # Loads the images at their base resolution into a single atlas, one image wide slot per piece, from the
+    # asset bundle if there is one. Doesn't need the display, so it can run on another thread while the
+    # window is being set up.
+    def load(self):
+        bundle = AssetBundle.open_default()
+        if bundle is None:
+            self.base_atlas = Images._build_atlas([pygame.image.load(asset_path("images", file)) for _, file in PIECE_IMAGES])
+        else:
+            # The bundle's images point into the mapped file, the atlas is a copy of them.
+            with bundle:
+                self.base_atlas = Images._build_atlas([bundle.image("images/" + file) for _, file in PIECE_IMAGES])
 
-        self.base_king_white = pygame.image.load(os.path.join(location, "images\\wk.png")).convert_alpha()
-        self.base_king_black = pygame.image.load(os.path.join(location, "images\\bk.png")).convert_alpha()
+    def _build_atlas(images):
+        width, height = images[0].get_size()
+        atlas = pygame.Surface((width * len(images), height), pygame.SRCALPHA)
+        for slot, image in enumerate(images):
+            atlas.blit(image, (slot * width, 0))
+        return atlas
 
-        self.scale(size)
+    # Finishes loading once the display is set up (loading first if load() hasn't been called).
+    def init(self, size):
+        if self.base_atlas is None:
+            self.load()
+        self.base_atlas = self.base_atlas.convert_alpha()
 
-    def scale(self, size):
-        # Scale the images from their base resolution to the desired resolution.
-        self.pawn_white = pygame.transform.smoothscale(self.base_pawn_white, size)
-        self.pawn_black = pygame.transform.smoothscale(self.base_pawn_black, size)
+        # Atlas slot for each piece code, -1 for codes that aren't pieces.
+        self.slots = [-1] * PIECE_CODES
+        for slot, (piece, _) in enumerate(PIECE_IMAGES):
+            self.slots[piece] = slot
 
-        self.rook_white = pygame.transform.smoothscale(self.base_rook_white, size)
-        self.rook_black = pygame.transform.smoothscale(self.base_rook_black, size)
+        # Scaled atlases, keyed by size and ordered from least to most recently used, and the image for
+        # each piece code at the current size (None for EMPTY).
+        self.scaled = OrderedDict()
+        self.images = [None] * PIECE_CODES
 
-        self.knight_white = pygame.transform.smoothscale(self.base_knight_white, size)
-        self.knight_black = pygame.transform.smoothscale(self.base_knight_black, size)
+        self.scale(size)
 
-        self.bishop_white = pygame.transform.smoothscale(self.base_bishop_white, size)
-        self.bishop_black = pygame.transform.smoothscale(self.base_bishop_black, size)
+    def scale(self, size):
+        size = tuple(size)
+        images = self.scaled.get(size)
+        if images is not None:
+            self.scaled.move_to_end(size)
+        else:
+            # Scale the whole atlas in one go and cut the pieces out of it as subsurfaces, which share its pixels.
+            atlas = pygame.transform.smoothscale(self.base_atlas, (size[0] * len(PIECE_IMAGES), size[1]))
+            images = [None] * PIECE_CODES
+            for piece, slot in enumerate(self.slots):
+                if slot != -1:
+                    images[piece] = atlas.subsurface((slot * size[0], 0, size[0], size[1]))
 
-        self.queen_white = pygame.transform.smoothscale(self.base_queen_white, size)
-        self.queen_black = pygame.transform.smoothscale(self.base_queen_black, size)
+            self.scaled[size] = images
+            if len(self.scaled) > SCALED_CACHE_SIZE:
+                self.scaled.popitem(last=False)
 
-        self.king_white = pygame.transform.smoothscale(self.base_king_white, size)
-        self.king_black = pygame.transform.smoothscale(self.base_king_black, size)
+        self.images = images
 
     # Get the image for a piece id.
     def get_image_for_piece(self, piece):
-        match piece:
-            case Piece.WHITE_PAWN:
-                return self.pawn_white
-            case Piece.BLACK_PAWN:
-                return self.pawn_black
-            case Piece.WHITE_ROOK:
-                return self.rook_white
-            case Piece.BLACK_ROOK:
-                return self.rook_black
-            case Piece.WHITE_KNIGHT:
-                return self.knight_white
-            case Piece.BLACK_KNIGHT:
-                return self.knight_black
-            case Piece.WHITE_BISHOP:
-                return self.bishop_white
-            case Piece.BLACK_BISHOP:
-                return self.bishop_black
-            case Piece.WHITE_QUEEN:
-                return self.queen_white
-            case Piece.BLACK_QUEEN:
-                return self.queen_black
-            case Piece.WHITE_KING:
-                return self.king_white
-            case Piece.BLACK_KING:
-                return self.king_black
-            case _:
-                return None
-        
-
+        return self.images[piece]
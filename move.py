@@ -0,0 +1,66 @@
+# --------------------------------------------------------------------------------------------------------
+# Chess with PyGame
+# Created by Martin Blore 2023
+# Full explanation can be found at https://codewithmartin.io/articles/how-to-code-a-chess-game-in-python
+# --------------------------------------------------------------------------------------------------------
+from bitboard import SQUARE_TO_POS
+from piece import BISHOP, BLACK, EMPTY, KNIGHT, QUEEN, ROOK
+
+'''
+Moves used by the search are packed into one 16-bit int:
+
+    bits 0-5    start square index (row * 8 + col)
+    bits 6-11   end square index
+    bits 12-15  flags
+
+Unlike (start_square, end_square, promotion) tuples they carry what kind of move they are, and
+ints aren't tracked by the garbage collector, so generating millions of them causes no GC pauses.
+'''
+
+# Flags.
+QUIET = 0
+DOUBLE_PAWN_PUSH = 1
+KING_CASTLE = 2
+QUEEN_CASTLE = 3
+CAPTURE = 4
+EN_PASSANT = 5
+PROMOTION = 8
+
+# On a promotion the low two flag bits pick the piece type, and CAPTURE is set too if it takes a piece.
+PROMOTION_TYPES = (KNIGHT, BISHOP, ROOK, QUEEN)
+
+# Set on captures, en-passant and promotions: the moves the quiescence search looks at.
+TACTICAL_BITS = (CAPTURE | PROMOTION) << 12
+
+# Longest possible move list (the most legal moves in any known position is 218).
+MAX_MOVES = 256
+
+# Number of per-ply buffers a search keeps, deeper than any search or capture sequence can go.
+MAX_PLY = 128
+
+class Move:
+    def encode(start_index, end_index, flags):
+        return start_index | end_index << 6 | flags << 12
+
+    def start(move):
+        return move & 63
+
+    def end(move):
+        return move >> 6 & 63
+
+    def flags(move):
+        return move >> 12
+
+    # The (start_square, end_square, promotion) tuple the rest of the board API uses.
+    def to_tuple(move, white):
+        promotion = EMPTY
+        if move >> 12 & PROMOTION:
+            promotion = (0 if white else BLACK) | PROMOTION_TYPES[move >> 12 & 3]
+        return SQUARE_TO_POS[move & 63], SQUARE_TO_POS[move >> 6 & 63], promotion
+
+# Preallocated move lists, one per search ply, so move generation fills existing lists instead of making new ones.
+# scores is a matching buffer for move ordering.
+class MoveBuffers:
+    def __init__(self, plies = MAX_PLY):
+        self.moves = [[0] * MAX_MOVES for _ in range(plies)]
+        self.scores = [[0] * MAX_MOVES for _ in range(plies)]
@@ -22,9 +22,9 @@ class MoveResult:
         # Set to true when the opponent is now in stale mate.
         self.opponent_stale_mate = False
 
-        # Set to true if a pawn is now available to be promoted.
+        # Set to true if the move promoted a pawn.
         self.promote_available = False
 
-        # The position of the pawn that can be promoted.
+        # The square of the promoted pawn.
         self.promote_position = (0,0)
         
\ No newline at end of file
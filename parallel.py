@@ -0,0 +1,179 @@
+# --------------------------------------------------------------------------------------------------------
+# Chess with PyGame
+# Created by Martin Blore 2023
+# Full explanation can be found at https://codewithmartin.io/articles/how-to-code-a-chess-game-in-python
+# --------------------------------------------------------------------------------------------------------
+
+# Spreads perft and engine searches over a pool of worker processes, one task per root move.
+# Positions are sent to the workers as Board.encode() bytes, and each worker keeps one Board
+# (and Engine) that it decodes every task into, so nothing heavier than a few bytes is pickled.
+#
+# Usage:
+#   with WorkerPool() as pool:
+#       nodes = pool.perft(board, 5)
+#       result = pool.search(board, max_depth=6)
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from board import Board
+from engine import MATE_SCORE, MATE_THRESHOLD, MAX_DEPTH, Engine, SearchResult
+from perft import Perft
+
+# The board and engine owned by this worker process, made once by _init_worker.
+_worker_board = None
+_worker_engine = None
+
+def _init_worker(hash_size_mb):
+    global _worker_board, _worker_engine
+    _worker_board = Board()
+    _worker_engine = Engine(_worker_board, hash_size_mb)
+
+def _perft_task(task):
+    encoded, depth = task
+    _worker_board.decode(encoded)
+    if depth <= 0:
+        return 1
+    return Perft(_worker_board).count(depth)
+
+# Searches the position after one root move. Returns the score from that position's side to move,
+# the depth completed, the nodes searched and the line found, or None if the limits were hit before the
+# first iteration finished, so there is no score. A depth of 0 scores the position with quiescence alone.
+# The time limit is given as a deadline on the wall clock, which every process shares, so time spent
+# starting the worker or waiting for it comes out of the task's budget instead of being added to it.
+def _search_task(task):
+    encoded, max_depth, deadline, node_limit = task
+    _worker_board.decode(encoded)
+    time_limit = max(0.001, deadline - time.time()) if deadline else None
+
+    # The engine has nothing to search when the root move ends the game.
+    if not _worker_board.generate_legal_moves():
+        if _worker_board._is_player_in_check(_worker_board.board_state, _worker_board.whites_turn):
+            return -MATE_SCORE, max_depth, 1, []
+        return 0, max_depth, 1, []
+
+    if max_depth <= 0:
+        score = _worker_engine.quiescence_score()
+        return score, 0, _worker_engine.nodes, []
+
+    result = _worker_engine.search(max_depth, time_limit, node_limit)
+    if result.depth == 0:
+        return None
+    return result.score, result.depth, result.nodes, result.pv
+
+class WorkerPool:
+    def __init__(self, workers = None, hash_size_mb = 16):
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(hash_size_mb,))
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Node counts split by root move, each root move counted in its own task.
+    def divide(self, board, depth):
+        moves = board.generate_legal_moves()
+        tasks = []
+        for move in moves:
+            board.make_move(move)
+            tasks.append((board.encode(), depth - 1))
+            board.unmake_move()
+
+        return list(zip(moves, self.executor.map(_perft_task, tasks)))
+
+    def perft(self, board, depth):
+        if depth <= 0:
+            return 1
+        return sum(nodes for _, nodes in self.divide(board, depth))
+
+    # Searches every root move in its own task and keeps the best. The root moves don't share alpha-beta
+    # bounds or a transposition table, so this does more work in total than Engine.search, in exchange
+    # for using every core.
+    # Limits are as Engine.search, except there must be at least one, since a running pool search can't be
+    # stopped. When there are more root moves than workers the tasks run in rounds: only one task per worker
+    # is handed out at a time, each new task gets an equal share of the time that is actually left for the
+    # rounds still to come, and root moves that haven't been started when the time runs out are skipped,
+    # as are root moves whose task ran out before finishing an iteration. The depth reported is the one every
+    # remaining root move was searched to, and never more than max_depth; with none left it is 0 and the best
+    # move is just the first legal one, as when Engine.search is cut short.
+    # The node limit is split between the root moves.
+    def search(self, board, max_depth = MAX_DEPTH, time_limit = None, node_limit = None):
+        if max_depth >= MAX_DEPTH and not time_limit and not node_limit:
+            raise Exception("A parallel search needs a depth, time or node limit.")
+
+        start_time = time.perf_counter()
+        deadline = time.time() + time_limit if time_limit else None
+        result = SearchResult()
+        moves = board.generate_legal_moves()
+        if not moves:
+            return result
+
+        task_nodes = max(1, node_limit // len(moves)) if node_limit else None
+        # The root move is the first ply, so max_depth 1 only scores the positions after it.
+        task_depth = max(0, min(max_depth, MAX_DEPTH) - 1)
+
+        tasks = []
+        for move in moves:
+            board.make_move(move)
+            tasks.append((board.encode(), task_depth, task_nodes))
+            board.unmake_move()
+
+        # Results by root move, None for root moves that were skipped or have no score.
+        results = [None] * len(moves)
+        running = {}
+        next_task = 0
+        while next_task < len(tasks) or running:
+            # Keep every worker busy while there is time left. The first task always starts, so there is a move.
+            while next_task < len(tasks) and len(running) < self.workers:
+                task_deadline = None
+                if deadline:
+                    time_left = deadline - time.time()
+                    if time_left <= 0 and next_task > 0:
+                        break
+                    rounds_left = -(-(len(tasks) - next_task) // self.workers)
+                    task_deadline = time.time() + max(0.0, time_left) / rounds_left
+
+                encoded, depth, nodes = tasks[next_task]
+                running[self.executor.submit(_search_task, (encoded, depth, task_deadline, nodes))] = next_task
+                next_task += 1
+
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+
+        result.score = None
+        depth = None
+        for move, task_result in zip(moves, results):
+            if task_result is None:
+                continue
+            score, searched_depth, nodes, pv = task_result
+
+            # Back to the root's point of view, one ply further from any mate.
+            score = -score
+            if score >= MATE_THRESHOLD:
+                score -= 1
+            elif score <= -MATE_THRESHOLD:
+                score += 1
+
+            result.nodes += nodes
+            depth = searched_depth if depth is None else min(depth, searched_depth)
+            if result.score is None or score > result.score:
+                result.score = score
+                result.best_move = move
+                result.pv = [move] + pv
+
+        if depth is None:
+            result.score = 0
+            result.best_move = moves[0]
+            result.pv = []
+            result.depth = 0
+        else:
+            result.depth = min(depth + 1, max_depth)
+        result.seconds = time.perf_counter() - start_time
+        return result
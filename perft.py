@@ -0,0 +1,252 @@
+# --------------------------------------------------------------------------------------------------------
+# Chess with PyGame
+# Created by Martin Blore 2023
+# Full explanation can be found at https://codewithmartin.io/articles/how-to-code-a-chess-game-in-python
+# --------------------------------------------------------------------------------------------------------
+
+# Perft (performance test) counts every leaf node of the legal move tree to a fixed depth.
+# The counts for the positions below are published, so a mismatch means the move generator is wrong,
+# and the timings give a repeatable benchmark for it.
+#
+# Usage:
+#   python perft.py                                 Run the benchmark suite.
+#   python perft.py --save-baseline perft.json      Run the suite and store the results.
+#   python perft.py --baseline perft.json           Run the suite and fail if it is slower than the stored results.
+#   python perft.py --fen "<fen>" --depth 3 --divide
+#   python perft.py --workers 8                     Split each position by root move over 8 processes.
+import argparse
+import json
+import sys
+import time
+from board import Board
+from board_setup import FEN_PIECES, BoardSetup
+from move import MoveBuffers
+
+# Test positions with their published node counts, indexed by depth - 1.
+PERFT_POSITIONS = {
+    "start": ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+        [20, 400, 8902, 197281, 4865609]),
+    "kiwipete": ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+        [48, 2039, 97862, 4085603]),
+    "position3": ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+        [14, 191, 2812, 43238, 674624]),
+    "position4": ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+        [6, 264, 9467, 422333]),
+    "position5": ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+        [44, 1486, 62379, 2103487]),
+}
+
+# Depths used by the suite, chosen so a full run stays short enough to run on every change.
+SUITE_DEPTHS = {
+    "start": 4,
+    "kiwipete": 3,
+    "position3": 5,
+    "position4": 4,
+    "position5": 3,
+}
+
+# Allowed slowdown against a baseline before the run fails.
+DEFAULT_TOLERANCE = 0.2
+
+# Each position is timed this many times and the fastest run is kept, to filter out scheduler noise.
+DEFAULT_REPEAT = 3
+
+PROMOTION_LETTERS = {piece: letter.lower() for letter, piece in FEN_PIECES.items()}
+
+# Counts leaf nodes while timing the move generation, make and unmake phases separately.
+class Perft:
+    def __init__(self, board):
+        self.board = board
+        self.buffers = MoveBuffers()
+        self.movegen_time = 0.0
+        self.make_time = 0.0
+        self.unmake_time = 0.0
+
+    # Each ply generates into its own preallocated buffer, so counting allocates no move lists.
+    def count(self, depth, ply = 0):
+        board = self.board
+        clock = time.perf_counter
+        moves = self.buffers.moves[ply]
+
+        start = clock()
+        move_count = board.generate_moves(moves)
+        self.movegen_time += clock() - start
+
+        if depth <= 1:
+            return move_count
+
+        nodes = 0
+        for i in range(move_count):
+            start = clock()
+            board.make_move_code(moves[i])
+            self.make_time += clock() - start
+
+            nodes += self.count(depth - 1, ply + 1)
+
+            start = clock()
+            board.unmake_move()
+            self.unmake_time += clock() - start
+
+        return nodes
+
+    # Node counts split by root move, for tracking down a wrong count.
+    def divide(self, depth):
+        results = []
+        for move in self.board.generate_legal_moves():
+            self.board.make_move(move)
+            nodes = self.count(depth - 1) if depth > 1 else 1
+            self.board.unmake_move()
+            results.append((move, nodes))
+        return results
+
+    # Long algebraic name for a move, e.g. e2e4 or a7a8q.
+    def move_name(move):
+        start_square, end_square, promotion = move
+        name = Perft.square_name(start_square) + Perft.square_name(end_square)
+        if promotion in PROMOTION_LETTERS:
+            name += PROMOTION_LETTERS[promotion]
+        return name
+
+    def square_name(square):
+        return "abcdefgh"[square[1]] + str(8 - square[0])
+
+# Runs perft on one position and returns the measurements of its fastest run.
+# With a parallel.WorkerPool the root moves are counted in the pool, and the phases aren't timed.
+def run_position(fen, depth, repeat = 1, pool = None):
+    best = None
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        board = Board()
+        BoardSetup.setup_fen(board, fen)
+        setup_time = time.perf_counter() - start
+
+        perft = Perft(board)
+        start = time.perf_counter()
+        nodes = pool.perft(board, depth) if pool is not None else perft.count(depth)
+        seconds = time.perf_counter() - start
+
+        if best is None or seconds < best[1]:
+            best = (nodes, seconds, setup_time, perft)
+
+    nodes, seconds, setup_time, perft = best
+
+    return {
+        "fen": fen,
+        "depth": depth,
+        "nodes": nodes,
+        "seconds": seconds,
+        "nps": nodes / seconds if seconds > 0 else 0.0,
+        "phases": {
+            "setup": setup_time,
+            "movegen": perft.movegen_time,
+            "make": perft.make_time,
+            "unmake": perft.unmake_time,
+        },
+    }
+
+def run_suite(depth_override = None, repeat = DEFAULT_REPEAT, pool = None):
+    results = {}
+    for name, (fen, expected) in PERFT_POSITIONS.items():
+        depth = min(depth_override or SUITE_DEPTHS[name], len(expected))
+        result = run_position(fen, depth, repeat, pool)
+        result["expected"] = expected[depth - 1]
+        results[name] = result
+    return results
+
+def print_result(name, result):
+    phases = result["phases"]
+    status = ""
+    if "expected" in result:
+        status = "ok" if result["nodes"] == result["expected"] else "WRONG (expected {})".format(result["expected"])
+
+    print("{:<10} depth {}  nodes {:>9}  {:>8.3f}s  {:>9.0f} nps  {}".format(
+        name, result["depth"], result["nodes"], result["seconds"], result["nps"], status))
+    print("{:<10} movegen {:.3f}s  make {:.3f}s  unmake {:.3f}s  setup {:.5f}s".format(
+        "", phases["movegen"], phases["make"], phases["unmake"], phases["setup"]))
+
+# Compares a run against stored results, returning a list of failure messages.
+def compare_to_baseline(results, baseline, tolerance):
+    failures = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        previous = baseline[name]
+        if previous["depth"] != result["depth"]:
+            continue
+        if previous["nodes"] != result["nodes"]:
+            failures.append("{}: node count {} differs from baseline {}".format(name, result["nodes"], previous["nodes"]))
+        if result["nps"] < previous["nps"] * (1.0 - tolerance):
+            failures.append("{}: {:.0f} nps is more than {:.0%} below baseline {:.0f} nps".format(
+                name, result["nps"], tolerance, previous["nps"]))
+    return failures
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Perft move generator benchmark and regression check.")
+    parser.add_argument("--fen", help="run a single position instead of the suite")
+    parser.add_argument("--depth", type=int, help="depth to search (overrides the suite depths)")
+    parser.add_argument("--divide", action="store_true", help="print node counts per root move (needs --fen)")
+    parser.add_argument("--baseline", help="JSON results to compare against, fails on a regression")
+    parser.add_argument("--save-baseline", help="write the results to this JSON file")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="time each position this many times and keep the fastest")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed nodes per second slowdown (0.2 = 20%%)")
+    parser.add_argument("--workers", type=int, help="split each position by root move over this many processes")
+    args = parser.parse_args(argv)
+
+    pool = None
+    if args.workers:
+        # Imported here because parallel imports this module for Perft.
+        from parallel import WorkerPool
+        pool = WorkerPool(args.workers)
+
+    try:
+        return _run(args, pool)
+    finally:
+        if pool is not None:
+            pool.close()
+
+def _run(args, pool):
+    if args.fen:
+        depth = args.depth or 1
+        if args.divide:
+            board = Board()
+            BoardSetup.setup_fen(board, args.fen)
+            total = 0
+            divide = pool.divide(board, depth) if pool is not None else Perft(board).divide(depth)
+            for move, nodes in divide:
+                print("{}: {}".format(Perft.move_name(move), nodes))
+                total += nodes
+            print("total: {}".format(total))
+            return 0
+
+        results = {"fen": run_position(args.fen, depth, args.repeat, pool)}
+    else:
+        results = run_suite(args.depth, args.repeat, pool)
+
+    failed = False
+    for name, result in results.items():
+        print_result(name, result)
+        if "expected" in result and result["nodes"] != result["expected"]:
+            failed = True
+
+    total_nodes = sum(result["nodes"] for result in results.values())
+    total_seconds = sum(result["seconds"] for result in results.values())
+    print("total      nodes {}  {:.3f}s  {:.0f} nps".format(
+        total_nodes, total_seconds, total_nodes / total_seconds if total_seconds > 0 else 0.0))
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        failures = compare_to_baseline(results, baseline, args.tolerance)
+        for failure in failures:
+            print("REGRESSION " + failure)
+        if failures:
+            failed = True
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as file:
+            json.dump(results, file, indent=2)
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,274 @@
+# --------------------------------------------------------------------------------------------------------
+# Chess with PyGame
+# Created by Martin Blore 2023
+# Full explanation can be found at https://codewithmartin.io/articles/how-to-code-a-chess-game-in-python
+# --------------------------------------------------------------------------------------------------------
+
+# Streams games out of PGN files of any size. The file is memory mapped and read a line at a time, so
+# only the game being replayed is ever held in memory, and everything is a generator, so nothing is parsed
+# until it is asked for.
+#
+# Every SAN move is resolved to the one legal move it names and played on a single reused Board, which
+# validates the game as it goes. Only the pieces that could reach the target square are considered
+# (found with the attack tables from the target), rather than generating every legal move.
+#
+# Usage:
+#   with PgnReader("games.pgn") as reader:
+#       for game in reader.games():
+#           game.headers, game.moves, game.result, game.error
+#       for game, board in reader.positions():
+#           board.to_fen()
+import mmap
+import re
+from attack_tables import KING_ATTACKS, KNIGHT_ATTACKS, bishop_attacks, queen_attacks, rook_attacks
+from bitboard import Bitboards
+from board import Board
+from board_setup import STANDARD_FEN
+from piece import BISHOP, BLACK, EMPTY, KING, KNIGHT, PAWN, QUEEN, ROOK
+from piece_moves import PieceMoves
+
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+_RESULT_TOKENS = tuple(result.encode() for result in RESULTS)
+
+SAN_PIECES = {"N": KNIGHT, "B": BISHOP, "R": ROOK, "Q": QUEEN, "K": KING}
+
+# Movetext tokens: comments, variation brackets, NAGs, results, move numbers, then anything else is a move.
+_TOKEN = re.compile(r"\{[^}]*\}|;[^\n]*|\(|\)|\$\d+|1-0|0-1|1/2-1/2|\*|\d+\.+|[^\s(){};$]+")
+
+_SAN = re.compile(r"([NBRQK])?([a-h])?([1-8])?x?([a-h])([1-8])(?:=?([NBRQ]))?")
+
+_HEADER = re.compile(r'\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]')
+
+# File and rank masks for SAN disambiguation, indexed by file (col) and by rank number.
+_FILE_MASKS = [0x0101010101010101 << col for col in range(8)]
+_RANK_MASKS = [0] + [0xFF << ((8 - rank) * 8) for rank in range(1, 9)]
+
+# One game read from the file.
+class PgnGame:
+    def __init__(self):
+        self.headers = {}
+
+        # The moves played, as (start_square, end_square, promotion) tuples.
+        self.moves = []
+
+        # The result token from the movetext, or the Result header if the movetext has none.
+        self.result = "*"
+
+        # Why the game stopped being replayed (an illegal, ambiguous or unreadable move), None for a valid game.
+        self.error = None
+
+class PgnReader:
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # An empty file can't be mapped.
+            self.data = b""
+
+        # Every game is replayed on this board, so positions yielded by positions() are only valid until the next one.
+        self.board = Board()
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Yields (headers, movetext) for every game without touching the rules, for when only the tags are needed.
+    def raw_games(self):
+        data = self.data
+        size = len(data)
+        offset = 0
+        headers = {}
+        movetext = []
+
+        while offset < size:
+            end = data.find(b"\n", offset)
+            if end == -1:
+                end = size
+            line = data[offset:end].strip()
+            offset = end + 1
+
+            if line.startswith(b"["):
+                # A tag after movetext starts the next game.
+                if movetext:
+                    yield headers, " ".join(movetext)
+                    headers = {}
+                    movetext = []
+                match = _HEADER.match(line.decode("utf-8", "replace"))
+                if match:
+                    headers[match.group(1)] = match.group(2).replace('\\"', '"').replace("\\\\", "\\")
+            elif line and not line.startswith(b"%"):
+                movetext.append(line.decode("latin-1"))
+
+                # Games without tags are only separated by their result.
+                if line.rsplit(None, 1)[-1] in _RESULT_TOKENS:
+                    yield headers, " ".join(movetext)
+                    headers = {}
+                    movetext = []
+
+        if headers or movetext:
+            yield headers, " ".join(movetext)
+
+    # Yields a PgnGame for every game, with every move resolved and checked.
+    def games(self):
+        for game, board in self._replay(False):
+            yield game
+
+    # Yields (game, board) for every position of every game, starting with each game's initial position.
+    # The board is the reader's own board and changes on the next step, and game.moves so far ends with the
+    # move that led to it.
+    def positions(self):
+        return self._replay(True)
+
+    def _replay(self, every_position):
+        board = self.board
+        for headers, movetext in self.raw_games():
+            game = PgnGame()
+            game.headers = headers
+            game.result = headers.get("Result", "*")
+
+            try:
+                board.load_fen(headers["FEN"] if "FEN" in headers else STANDARD_FEN)
+            except Exception:
+                game.error = "Invalid FEN header."
+                yield game, board
+                continue
+
+            if every_position:
+                yield game, board
+
+            variation_depth = 0
+            for token in _TOKEN.findall(movetext):
+                first = token[0]
+                if first == "(":
+                    variation_depth += 1
+                elif first == ")":
+                    variation_depth -= 1
+                elif variation_depth > 0 or first == "{" or first == ";" or first == "$" or first.isdigit() and token[-1] == ".":
+                    continue
+                elif token in RESULTS:
+                    game.result = token
+                    break
+                else:
+                    move = resolve_san(board, token)
+                    if move is None:
+                        game.error = "Illegal or ambiguous move {} after {} moves.".format(token, len(game.moves))
+                        break
+
+                    board.make_move(move)
+
+                    # Replaying never takes a move back, so drop the undo record to keep memory flat on long games.
+                    board.move_stack.pop()
+                    game.moves.append(move)
+
+                    if every_position:
+                        yield game, board
+
+            if not every_position:
+                yield game, board
+
+# Returns the legal (start_square, end_square, promotion) move a SAN string names for the side to move,
+# or None if it names no legal move or more than one.
+def resolve_san(board, san):
+    san = san.rstrip("+#!?")
+    white = board.whites_turn
+    colour = 0 if white else BLACK
+
+    if san in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        row = 7 if white else 0
+        end_square = (row, 6 if len(san) == 3 else 2)
+        if board.board_state[row][4] != colour | KING or end_square not in PieceMoves.moves_for_king(board, (row, 4)):
+            return None
+        return _legal_or_none(board, [((row, 4), end_square, EMPTY)])
+
+    match = _SAN.fullmatch(san)
+    if match is None:
+        return None
+    piece_letter, from_file, from_rank, to_file, to_rank, promotion_letter = match.groups()
+
+    end_square = (8 - int(to_rank), ord(to_file) - ord("a"))
+    end_index = end_square[0] * 8 + end_square[1]
+    bitboards = board.bitboards
+    if bitboards.side(white) >> end_index & 1:
+        return None
+
+    promotion = EMPTY
+    if promotion_letter is not None:
+        promotion = colour | SAN_PIECES[promotion_letter]
+
+    if piece_letter is None:
+        return _resolve_pawn(board, colour, from_file, end_square, promotion)
+
+    if promotion != EMPTY:
+        return None
+
+    piece_type = SAN_PIECES[piece_letter]
+    occupied = bitboards.occupied
+    if piece_type == KNIGHT:
+        candidates = KNIGHT_ATTACKS[end_index]
+    elif piece_type == BISHOP:
+        candidates = bishop_attacks(end_index, occupied)
+    elif piece_type == ROOK:
+        candidates = rook_attacks(end_index, occupied)
+    elif piece_type == QUEEN:
+        candidates = queen_attacks(end_index, occupied)
+    else:
+        candidates = KING_ATTACKS[end_index]
+
+    # The moves are symmetric, so the pieces that can reach the target are the ones it attacks.
+    candidates &= bitboards.pieces[colour | piece_type]
+    if from_file is not None:
+        candidates &= _FILE_MASKS[ord(from_file) - ord("a")]
+    if from_rank is not None:
+        candidates &= _RANK_MASKS[int(from_rank)]
+
+    return _legal_or_none(board, [(start_square, end_square, EMPTY) for start_square in Bitboards.squares(candidates)])
+
+def _resolve_pawn(board, colour, from_file, end_square, promotion):
+    pawn = colour | PAWN
+    step = 1 if colour == 0 else -1
+    last_row = 0 if colour == 0 else 7
+    if (end_square[0] == last_row) != (promotion != EMPTY):
+        return None
+
+    state = board.board_state
+    row = end_square[0] + step
+    if not 0 <= row <= 7:
+        return None
+
+    if from_file is not None:
+        start_square = (row, ord(from_file) - ord("a"))
+    elif state[row][end_square[1]] == pawn:
+        start_square = (row, end_square[1])
+    else:
+        # A double step from the starting row.
+        start_square = (row + step, end_square[1])
+        if not 0 <= start_square[0] <= 7:
+            return None
+
+    if state[start_square[0]][start_square[1]] != pawn:
+        return None
+    if end_square not in PieceMoves.get_moves_for_piece(board, pawn, start_square):
+        return None
+    return _legal_or_none(board, [(start_square, end_square, promotion)])
+
+# The single move from the candidates that doesn't leave the mover's king in check, or None.
+def _legal_or_none(board, candidates):
+    white = board.whites_turn
+    found = None
+    for move in candidates:
+        board.make_move(move)
+        legal = not board._is_player_in_check(board.board_state, white)
+        board.unmake_move()
+        if legal:
+            if found is not None:
+                return None
+            found = move
+    return found
@@ -4,9 +4,51 @@
 # Full explanation can be found at https://codewithmartin.io/articles/how-to-code-a-chess-game-in-python
 # --------------------------------------------------------------------------------------------------------
 
-from enum import Enum
+from enum import IntEnum
 
-class Piece(Enum):
+'''
+Pieces are stored as small ints with the piece type and colour in separate bit fields:
+
+    bits 0-2    type: 1 pawn, 2 knight, 3 bishop, 4 rook, 5 queen, 6 king
+    bit 3       colour: 0 white, 8 black
+
+0 is an empty square. Colour and type checks are then a single bit operation, and the
+codes index straight into lists (bitboards, hash keys, piece values).
+
+The rules code uses the plain int constants below, because looking up an enum member costs
+several times more than reading a module constant. Piece is an IntEnum over the same values,
+so Piece.WHITE_PAWN style code keeps working and compares equal to the ints on the board.
+'''
+
+EMPTY = 0
+
+PAWN = 1
+KNIGHT = 2
+BISHOP = 3
+ROOK = 4
+QUEEN = 5
+KING = 6
+
+TYPE_MASK = 7
+BLACK = 8
+
+WHITE_PAWN = PAWN
+WHITE_KNIGHT = KNIGHT
+WHITE_BISHOP = BISHOP
+WHITE_ROOK = ROOK
+WHITE_QUEEN = QUEEN
+WHITE_KING = KING
+BLACK_PAWN = BLACK | PAWN
+BLACK_KNIGHT = BLACK | KNIGHT
+BLACK_BISHOP = BLACK | BISHOP
+BLACK_ROOK = BLACK | ROOK
+BLACK_QUEEN = BLACK | QUEEN
+BLACK_KING = BLACK | KING
+
+# Size of lists indexed by piece code.
+PIECE_CODES = 15
+
+class Piece(IntEnum):
     NONE = 0
     WHITE_PAWN = 1
     WHITE_KNIGHT = 2
@@ -14,30 +56,22 @@ class Piece(Enum):
     WHITE_ROOK = 4
     WHITE_QUEEN = 5
     WHITE_KING = 6
-    BLACK_PAWN = 7
-    BLACK_KNIGHT = 8
-    BLACK_BISHOP = 9
-    BLACK_ROOK = 10
-    BLACK_QUEEN = 11
-    BLACK_KING = 12
+    BLACK_PAWN = 9
+    BLACK_KNIGHT = 10
+    BLACK_BISHOP = 11
+    BLACK_ROOK = 12
+    BLACK_QUEEN = 13
+    BLACK_KING = 14
 
     def is_white_piece(piece):
-        return (piece == Piece.WHITE_PAWN or
-            piece == Piece.WHITE_BISHOP or
-            piece == Piece.WHITE_ROOK or
-            piece == Piece.WHITE_KNIGHT or
-            piece == Piece.WHITE_KING or
-            piece == Piece.WHITE_QUEEN)
+        return piece != 0 and piece & BLACK == 0
 
     def is_black_piece(piece):
-        return not Piece.is_white_piece(piece)
+        return piece & BLACK != 0
 
     def is_enemy_piece(piece, target):
-        if (target == Piece.NONE):
-            return False
-        if Piece.is_white_piece(piece) and Piece.is_black_piece(target):
-            return True
-        if Piece.is_black_piece(piece) and Piece.is_white_piece(target):
-            return True
-
-        return False
\ No newline at end of file
+        return target != 0 and (piece ^ target) & BLACK != 0
+
+    # The piece type without its colour (PAWN to KING), 0 for an empty square.
+    def piece_type(piece):
+        return piece & TYPE_MASK
@@ -4,17 +4,31 @@
 # Full explanation can be found at https://codewithmartin.io/articles/how-to-code-a-chess-game-in-python
 # --------------------------------------------------------------------------------------------------------
 
-import os
+import io
 import pygame
+from assets import AssetBundle, asset_path
+
+SOUND_FILES = ("move.wav", "check.wav", "check_mate.wav")
 
 class Sounds():
-    def init(self):
-        location = os.path.realpath(
-            os.path.join(os.getcwd(), os.path.dirname(__file__)))
+    def __init__(self):
+        self.move_sound = None
+
+    # Decodes the sounds, from the asset bundle if there is one. Needs the mixer but not the display, so it
+    # can run on another thread while the window is being set up.
+    def load(self):
+        bundle = AssetBundle.open_default()
+        if bundle is not None:
+            with bundle:
+                sounds = [pygame.mixer.Sound(file=io.BytesIO(bundle.raw("sounds/" + file))) for file in SOUND_FILES]
+        else:
+            sounds = [pygame.mixer.Sound(asset_path("sounds", file)) for file in SOUND_FILES]
 
-        self.move_sound = pygame.mixer.Sound(os.path.join(location, "sounds\\move.wav"))
-        self.check_sound = pygame.mixer.Sound(os.path.join(location, "sounds\\check.wav"))
-        self.check_mate_sound = pygame.mixer.Sound(os.path.join(location, "sounds\\check_mate.wav"))
+        self.move_sound, self.check_sound, self.check_mate_sound = sounds
+
+    def init(self):
+        if self.move_sound is None:
+            self.load()
 
     def play_move(self):
         self.move_sound.play()
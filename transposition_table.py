@@ -0,0 +1,69 @@
+# --------------------------------------------------------------------------------------------------------
+# Chess with PyGame
+# Created by Martin Blore 2023
+# Full explanation can be found at https://codewithmartin.io/articles/how-to-code-a-chess-game-in-python
+# --------------------------------------------------------------------------------------------------------
+
+# Bound types stored with each score.
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+# Rough size of one stored entry in CPython (the entry tuple plus its key and score ints), used to turn
+# a memory budget into a slot count.
+ENTRY_BYTES = 160
+
+# A fixed-size hash table of search results, indexed by the low bits of the Zobrist key.
+# Entries are (key, depth, score, bound, move, age) tuples. The slot list is allocated once, so the
+# table never grows past its budget however long the search runs.
+class TranspositionTable:
+    def __init__(self, size_mb = 16):
+        self.resize(size_mb)
+
+    # Reallocates the table for a new memory budget, dropping every stored entry.
+    def resize(self, size_mb):
+        slots = max(1, int(size_mb * 1024 * 1024) // ENTRY_BYTES)
+
+        # Round down to a power of two so a slot is found with a mask instead of a modulo.
+        self.size = 1 << (slots.bit_length() - 1)
+        self.mask = self.size - 1
+        self.entries = [None] * self.size
+        self.age = 0
+        self.used = 0
+
+    def clear(self):
+        for i in range(self.size):
+            self.entries[i] = None
+        self.age = 0
+        self.used = 0
+
+    # Called at the start of every new search, so entries from earlier searches are replaced first.
+    def new_search(self):
+        self.age = (self.age + 1) & 0xFF
+
+    # Returns the stored entry for this key, or None.
+    def probe(self, key):
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    # Stores a result. Replacement policy: always take empty slots, the same position, or slots left over from
+    # an earlier search; otherwise only replace an entry searched to the same depth or shallower.
+    def store(self, key, depth, score, bound, move):
+        index = key & self.mask
+        entry = self.entries[index]
+
+        if entry is None:
+            self.used += 1
+        elif entry[0] != key and entry[5] == self.age and entry[1] > depth:
+            return
+        elif entry[0] == key and move is None:
+            # Keep the best move we already know for this position.
+            move = entry[4]
+
+        self.entries[index] = (key, depth, score, bound, move, self.age)
+
+    # How full the table is, in permille (the UCI hashfull convention).
+    def hashfull(self):
+        return self.used * 1000 // self.size
@@ -0,0 +1,202 @@
+# --------------------------------------------------------------------------------------------------------
+# Chess with PyGame
+# Created by Martin Blore 2023
+# Full explanation can be found at https://codewithmartin.io/articles/how-to-code-a-chess-game-in-python
+# --------------------------------------------------------------------------------------------------------
+
+# Runs the engine as a UCI (Universal Chess Interface) process over stdin/stdout, so it can be used by
+# chess GUIs, tournament managers and analysis tools. The search runs on a worker thread while the main
+# thread keeps reading commands, so stop (or quit) is acted on as soon as it arrives.
+#
+# Supported: uci, isready, ucinewgame, setoption name Hash value <mb>, position [startpos | fen <fen>]
+# [moves ...], go [depth n] [movetime ms] [nodes n] [infinite] [wtime ms] [btime ms] [winc ms] [binc ms]
+# [movestogo n], stop, quit.
+#
+# Usage:
+#   python uci.py
+import sys
+import threading
+from board import Board
+from board_setup import STANDARD_FEN
+from engine import MATE_SCORE, MATE_THRESHOLD, MAX_DEPTH, Engine
+from perft import Perft
+
+ENGINE_NAME = "chess-python"
+ENGINE_AUTHOR = "Martin Blore"
+
+DEFAULT_HASH_MB = 16
+MAX_HASH_MB = 4096
+
+# With a clock and no movestogo, plan for this many more moves.
+DEFAULT_MOVES_TO_GO = 30
+
+# Time kept back from every clock based move for the process and pipe overhead.
+MOVE_OVERHEAD = 0.05
+
+class UciEngine:
+    def __init__(self, input = sys.stdin, output = sys.stdout):
+        self.input = input
+        self.output = output
+        self.board = Board()
+        self.board.load_fen(STANDARD_FEN)
+        self.engine = Engine(self.board, DEFAULT_HASH_MB)
+
+        self.search_thread = None
+
+        # Set by stop: an infinite search that finishes early has to wait for it before giving its best move.
+        self.stop_event = threading.Event()
+
+        # The search thread and the command thread both write to the output.
+        self.output_lock = threading.Lock()
+
+    # Reads and handles commands until quit or the end of the input.
+    def run(self):
+        while True:
+            line = self.input.readline()
+            if not line or not self.handle(line):
+                break
+        self.stop_search()
+
+    # Handles one command line. Returns false when it was quit.
+    def handle(self, line):
+        tokens = line.split()
+        if not tokens:
+            return True
+        command = tokens[0]
+
+        if command == "uci":
+            self.send("id name " + ENGINE_NAME)
+            self.send("id author " + ENGINE_AUTHOR)
+            self.send("option name Hash type spin default {} min 1 max {}".format(DEFAULT_HASH_MB, MAX_HASH_MB))
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self._set_option(tokens)
+        elif command == "ucinewgame":
+            self.stop_search()
+            self.engine.table.clear()
+        elif command == "position":
+            self.stop_search()
+            self._position(tokens)
+        elif command == "go":
+            self.stop_search()
+            self._go(tokens)
+        elif command == "stop":
+            self.stop_search()
+        elif command == "quit":
+            return False
+
+        # Anything else (debug, register, unknown commands) is ignored, as the protocol asks.
+        return True
+
+    def send(self, text):
+        with self.output_lock:
+            self.output.write(text + "\n")
+            self.output.flush()
+
+    def _set_option(self, tokens):
+        # setoption name <name> [value <value>], the name can have spaces.
+        if "name" not in tokens:
+            return
+        name_start = tokens.index("name") + 1
+        value_start = tokens.index("value") if "value" in tokens else len(tokens)
+        name = " ".join(tokens[name_start:value_start]).lower()
+        value = " ".join(tokens[value_start + 1:])
+
+        if name == "hash" and value.isdigit():
+            self.stop_search()
+            self.engine.set_hash_size(max(1, min(int(value), MAX_HASH_MB)))
+
+    def _position(self, tokens):
+        moves_start = tokens.index("moves") if "moves" in tokens else len(tokens)
+        if len(tokens) > 1 and tokens[1] == "fen":
+            fen = " ".join(tokens[2:moves_start])
+        else:
+            fen = STANDARD_FEN
+
+        try:
+            self.board.load_fen(fen)
+        except Exception:
+            self.send("info string invalid fen " + fen)
+            self.board.load_fen(STANDARD_FEN)
+            return
+
+        for name in tokens[moves_start + 1:]:
+            moves = {Perft.move_name(move): move for move in self.board.generate_legal_moves()}
+            move = moves.get(name.lower())
+            if move is None:
+                self.send("info string illegal move " + name)
+                return
+            self.board.make_move(move)
+
+    def _go(self, tokens):
+        limits = {}
+        for i in range(1, len(tokens) - 1):
+            if tokens[i] in ("depth", "movetime", "nodes", "wtime", "btime", "winc", "binc", "movestogo"):
+                try:
+                    limits[tokens[i]] = int(tokens[i + 1])
+                except ValueError:
+                    pass
+        infinite = "infinite" in tokens
+
+        max_depth = limits.get("depth", MAX_DEPTH)
+        node_limit = limits.get("nodes")
+        time_limit = None
+        if "movetime" in limits:
+            time_limit = max(0.001, limits["movetime"] / 1000 - MOVE_OVERHEAD)
+        elif not infinite:
+            time_left = limits.get("wtime" if self.board.whites_turn else "btime")
+            if time_left is not None:
+                increment = limits.get("winc" if self.board.whites_turn else "binc", 0)
+                moves_to_go = limits.get("movestogo") or DEFAULT_MOVES_TO_GO
+                budget = time_left / moves_to_go + increment * 0.75
+
+                # Never plan to use more than half of what is left.
+                time_limit = max(0.001, min(budget, time_left / 2) / 1000 - MOVE_OVERHEAD)
+
+        self.stop_event.clear()
+        self.search_thread = threading.Thread(target=self._search, args=(max_depth, time_limit, node_limit, infinite),
+            daemon=True)
+        self.search_thread.start()
+
+    def _search(self, max_depth, time_limit, node_limit, infinite):
+        result = self.engine.search(max_depth, time_limit, node_limit, self._send_info)
+
+        # An infinite search only reports its move once it has been told to stop.
+        if infinite:
+            self.stop_event.wait()
+
+        if result.best_move is None:
+            self.send("bestmove 0000")
+        else:
+            self.send("bestmove " + Perft.move_name(result.best_move))
+
+    def _send_info(self, result):
+        if result.score >= MATE_THRESHOLD:
+            score = "mate {}".format((MATE_SCORE - result.score + 1) // 2)
+        elif result.score <= -MATE_THRESHOLD:
+            score = "mate -{}".format((MATE_SCORE + result.score + 1) // 2)
+        else:
+            score = "cp {}".format(result.score)
+
+        milliseconds = int(result.seconds * 1000)
+        nps = int(result.nodes / result.seconds) if result.seconds > 0 else 0
+        self.send("info depth {} score {} nodes {} nps {} time {} pv {}".format(result.depth, score, result.nodes,
+            nps, milliseconds, " ".join(Perft.move_name(move) for move in result.pv)))
+
+    # Stops a running search and waits for it to give its best move.
+    def stop_search(self):
+        thread = self.search_thread
+        if thread is None:
+            return
+
+        self.stop_event.set()
+        # The engine clears its stop flag when a search starts, so keep asking in case it hadn't started yet.
+        while thread.is_alive():
+            self.engine.stop()
+            thread.join(0.01)
+        self.search_thread = None
+
+if __name__ == "__main__":
+    UciEngine().run()
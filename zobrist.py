@@ -0,0 +1,25 @@
+# --------------------------------------------------------------------------------------------------------
+# Chess with PyGame
+# Created by Martin Blore 2023
+# Full explanation can be found at https://codewithmartin.io/articles/how-to-code-a-chess-game-in-python
+# --------------------------------------------------------------------------------------------------------
+import random
+from piece import PIECE_CODES
+
+# Random 64-bit keys for Zobrist hashing. A position's key is the XOR of the keys for each piece on its
+# square, its castling rights, its en-passant file and the side to move, so a move only has to XOR
+# the handful of keys that changed.
+# The generator is seeded so keys (and any stored hashes) are identical between runs and processes.
+_generator = random.Random(0x5A0B7157)
+
+# Indexed by piece code then square index. Codes that aren't pieces are never used.
+PIECE_SQUARE_KEYS = [[_generator.getrandbits(64) for _ in range(64)] for _ in range(PIECE_CODES)]
+
+# Indexed by the 4-bit castling rights mask (white king side, white queen side, black king side, black queen side).
+CASTLING_KEYS = [_generator.getrandbits(64) for _ in range(16)]
+
+# Indexed by the file of a capturable en-passant pawn.
+EN_PASSANT_KEYS = [_generator.getrandbits(64) for _ in range(8)]
+
+# Included when black is to move.
+BLACK_TO_MOVE_KEY = _generator.getrandbits(64)